@@ -0,0 +1,3 @@
+from benchmarks.generators import (generate_catalog, generate_order_history, generate_users,
+                                   write_dataset)
+from benchmarks.scenarios import SCENARIOS, run_benchmarks
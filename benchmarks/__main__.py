@@ -0,0 +1,22 @@
+import argparse
+import json
+
+from benchmarks.scenarios import SCENARIOS, run_benchmarks
+
+parser = argparse.ArgumentParser(description="Run shopping cart benchmarks and write the results as JSON.")
+parser.add_argument("--scale", type=int, default=1000, help="default size for products, users and orders")
+parser.add_argument("--products", type=int)
+parser.add_argument("--users", type=int)
+parser.add_argument("--orders", type=int)
+parser.add_argument("--samples", type=int, default=1000, help="operations timed per scenario")
+parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only these scenarios")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", help="write results to this file instead of stdout")
+args = parser.parse_args()
+
+results = run_benchmarks(args.scale, args.products, args.users, args.orders, args.samples, args.scenario, args.seed)
+if args.output:
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+else:
+    print(json.dumps(results, indent=4))
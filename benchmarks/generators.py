@@ -0,0 +1,65 @@
+import datetime
+import random
+
+from online_shopping_cart import Admin, JSONStorage, Product
+
+WORDS = ["wireless", "smart", "portable", "digital", "noise", "cancelling", "gaming", "compact", "premium",
+         "ultra", "mini", "pro", "max", "classic", "hd", "4k", "bluetooth", "mechanical", "ergonomic", "solar"]
+NOUNS = ["laptop", "phone", "headphones", "watch", "camera", "tablet", "printer", "monitor", "keyboard", "mouse",
+         "headset", "drone", "ssd", "doorbell", "earbuds", "speaker", "router", "charger", "lamp", "projector"]
+
+
+def generate_catalog(count, seed=0):
+    rng = random.Random(seed)
+    products = []
+    for product_id in range(1, count + 1):
+        name = f"{rng.choice(WORDS).title()} {rng.choice(NOUNS).title()} {product_id}"
+        description = " ".join(rng.choice(WORDS) for _ in range(6)) + " " + rng.choice(NOUNS)
+        products.append(Product(product_id, name, round(rng.uniform(5, 2000), 2), description, rng.randint(0, 500)))
+    return products
+
+
+def generate_users(count, catalog, cart_lines=5, seed=0):
+    rng = random.Random(seed)
+    users = []
+    for number in range(count):
+        users.append({
+            "first_name": f"First{number}",
+            "last_name": f"Last{number}",
+            "address": f"{number} Benchmark Street",
+            "username": f"user{number}",
+            "password": f"password{number}",
+            "cart": {"items": _random_cart(rng, catalog, cart_lines)},
+            "saved_cart": {"items": _random_cart(rng, catalog, rng.randint(0, cart_lines))},
+            "order_history": {"history": []}
+        })
+    return users
+
+
+def generate_order_history(count, users, catalog, max_lines=5, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    records = []
+    for number in range(count):
+        items = []
+        for product in rng.sample(catalog, min(rng.randint(1, max_lines), len(catalog))):
+            quantity = rng.randint(1, 3)
+            items.append((product.name, quantity, round(product.price * quantity, 2)))
+        purchase = {
+            "date": (start + datetime.timedelta(minutes=number)).isoformat(),
+            "items": items,
+            "total_price": round(sum(item[2] for item in items), 2),
+            "feedback": "Generated order"
+        }
+        records.append((rng.choice(users)['username'], purchase))
+    return records
+
+
+def write_dataset(directory, catalog, users, orders):
+    storage = JSONStorage(directory)
+    storage.import_records(catalog, [Admin("Maria", "maria123")], users, orders)
+    return storage
+
+
+def _random_cart(rng, catalog, lines):
+    return [(product.to_dict(), rng.randint(1, 3)) for product in rng.sample(catalog, min(lines, len(catalog)))]
@@ -0,0 +1,240 @@
+import contextlib
+import io
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.generators import generate_catalog, generate_order_history, generate_users, write_dataset
+from online_shopping_cart import (AlsoBought, Cart, CatalogFeed, InventoryManager, JSONStorage, ProductCatalog,
+                                  ProductListing, ShoppingCartApp)
+
+
+class BenchmarkContext:
+
+    def __init__(self, directory, products, users, orders, samples, seed):
+        self.directory = directory
+        self.product_count = products
+        self.samples = samples
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.user_records = generate_users(users, self.catalog(), seed=seed)
+        write_dataset(directory, self.catalog(), self.user_records,
+                      generate_order_history(orders, self.user_records, self.catalog(), seed=seed))
+
+    def catalog(self):
+        return generate_catalog(self.product_count, self.seed)
+
+    def sample_users(self):
+        return self.rng.sample(self.user_records, min(self.samples, len(self.user_records)))
+
+    def workspace(self, name):
+        target = os.path.join(os.path.dirname(self.directory), name)
+        shutil.copytree(self.directory, target)
+        return target
+
+    def open_app(self, directory, snapshot=True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return ShoppingCartApp(JSONStorage(directory, snapshot))
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    total = sum(timings)
+    count = len(timings)
+
+    def percentile(fraction):
+        return timings[min(int(fraction * count), count - 1)] * 1e6 if count else 0.0
+
+    return {
+        "operations": count,
+        "seconds": total,
+        "ops_per_second": count / total if total else 0.0,
+        "mean_us": total / count * 1e6 if count else 0.0,
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99)
+    }
+
+
+def measure(operation, arguments):
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for argument in arguments:
+            start = time.perf_counter()
+            operation(argument)
+            timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+def bench_startup(context):
+    directory = context.workspace("startup")
+    results = {}
+    for phase, snapshot in (("cold", False), ("warm", False), ("write_snapshot", True), ("snapshot", True)):
+        start = time.perf_counter()
+        app = context.open_app(directory, snapshot)
+        opened = time.perf_counter()
+        app.close()
+        if phase == "write_snapshot":
+            results[phase] = summarize([time.perf_counter() - opened])
+        else:
+            results[phase] = summarize([opened - start])
+    return results
+
+
+def bench_login(context):
+    app = context.open_app(context.workspace("login"))
+    users = context.sample_users()
+    try:
+        return {
+            "cold": measure(lambda u: app.authenticate_user(u['username'], u['password']), users),
+            "warm": measure(lambda u: app.authenticate_user(u['username'], u['password']), users)
+        }
+    finally:
+        app.close()
+
+
+def bench_cart_from_dict(context):
+    catalog = ProductCatalog(context.catalog())
+    return measure(lambda u: Cart.from_dict(u['cart'], catalog), context.sample_users())
+
+
+def bench_add_to_cart(context):
+    catalog = context.catalog()
+    products = [context.rng.choice(catalog) for _ in range(context.samples)]
+    inventory = InventoryManager()
+    results = {}
+    for name, cart in (("direct", Cart()), ("reserved", Cart(inventory))):
+        results[name] = measure(lambda p: cart.add_to_cart(p, 1), products)
+    return results
+
+
+def bench_checkout(context):
+    app = context.open_app(context.workspace("checkout"))
+    users = [app.users.get(u['username']) for u in context.sample_users()]
+    try:
+        return measure(lambda user: user.place_order("Benchmark order"), users)
+    finally:
+        app.close()
+
+
+def bench_persistence(context):
+    app = context.open_app(context.workspace("persistence"))
+    users = [app.users.get(u['username']) for u in context.sample_users()]
+    try:
+        record_cart = measure(app.users.record_cart, users)
+        mark_dirty = measure(app.users.mark_dirty, users)
+        flush = measure(lambda _: app.flush(), [None])
+        save_users = measure(lambda _: app.save_users(), [None])
+        return {"record_cart": record_cart, "mark_dirty": mark_dirty, "flush": flush, "save_users": save_users}
+    finally:
+        app.close()
+
+
+def bench_catalog_import(context):
+    directory = context.workspace("catalog_import")
+    feed = CatalogFeed(os.path.join(directory, "catalog.jsonl"))
+    feed.write(context.catalog())
+    results = {}
+    for phase in ("insert", "update"):
+        catalog = ProductCatalog() if phase == "insert" else ProductCatalog(context.catalog())
+        start = time.perf_counter()
+        catalog.upsert_many(feed)
+        results[phase] = summarize([time.perf_counter() - start])
+    return results
+
+
+def bench_listing(context):
+    listing = ProductListing(ProductCatalog(context.catalog()))
+    pages = range(1, min(listing.page_count(), listing.cache_size, context.samples) + 1)
+    return {
+        "cold": measure(listing.render, pages),
+        "cached": measure(listing.render, pages),
+        "by_price": measure(lambda page: listing.render(page, "price"), pages)
+    }
+
+
+def bench_recommendations(context):
+    records = list(JSONStorage(context.directory).order_records())
+    start = time.perf_counter()
+    engine = AlsoBought.load(records)
+    loaded = summarize([time.perf_counter() - start])
+    replayed = AlsoBought()
+    start = time.perf_counter()
+    for username, purchase in records:
+        replayed.record(username, purchase)
+    names = [context.rng.choice(context.catalog()).name for _ in range(context.samples)]
+    return {
+        "load": loaded,
+        "replay": summarize([time.perf_counter() - start]),
+        "record": measure(lambda record: engine.record(*record), records[:context.samples]),
+        "also_bought": measure(engine.also_bought, names),
+        "recommend": measure(lambda name: engine.recommend([name] + names[:4]), names)
+    }
+
+
+def bench_order_archive(context):
+    directory = context.workspace("order_archive")
+    records = list(JSONStorage(directory).order_records())
+    cutoff = records[len(records) * 9 // 10][1]['date'] if records else ""
+    usernames = [u['username'] for u in context.sample_users()]
+    results = {}
+    for phase in ("before", "after"):
+        start = time.perf_counter()
+        app = context.open_app(directory, snapshot=False)
+        opened = time.perf_counter()
+        try:
+            users = [app.users.get(username) for username in usernames]
+            results[phase] = {
+                "startup": summarize([opened - start]),
+                "log_bytes": os.path.getsize(os.path.join(directory, "orders.log")),
+                "recent_page": measure(lambda user: list(user.order_history.recent(0, 10)), users),
+                "full_history": measure(lambda user: list(user.order_history.purchases()), users)
+            }
+            if phase == "before":
+                start = time.perf_counter()
+                results["archived_orders"] = app.order_log.archive_before(cutoff)
+                results["archive"] = summarize([time.perf_counter() - start])
+        finally:
+            app.close()
+    results["archive_bytes"] = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                                   if name.endswith(".arc"))
+    return results
+
+
+SCENARIOS = {
+    "startup": bench_startup,
+    "login": bench_login,
+    "cart_from_dict": bench_cart_from_dict,
+    "add_to_cart": bench_add_to_cart,
+    "checkout": bench_checkout,
+    "persistence": bench_persistence,
+    "catalog_import": bench_catalog_import,
+    "listing": bench_listing,
+    "recommendations": bench_recommendations,
+    "order_archive": bench_order_archive
+}
+
+
+def run_benchmarks(scale=1000, products=None, users=None, orders=None, samples=1000, scenarios=None, seed=0):
+    products = products or scale
+    users = users or scale
+    orders = orders or scale
+    results = {
+        "scale": {"products": products, "users": users, "orders": orders, "samples": samples, "seed": seed},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scenarios": {}
+    }
+    with tempfile.TemporaryDirectory() as root:
+        dataset = os.path.join(root, "dataset")
+        os.mkdir(dataset)
+        start = time.perf_counter()
+        context = BenchmarkContext(dataset, products, users, orders, samples, seed)
+        results["setup_seconds"] = time.perf_counter() - start
+        for name in scenarios or SCENARIOS:
+            results["scenarios"][name] = SCENARIOS[name](context)
+    return results
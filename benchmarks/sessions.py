@@ -0,0 +1,307 @@
+import argparse
+import builtins
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.generators import NOUNS, generate_catalog, write_dataset
+from benchmarks.scenarios import summarize
+from online_shopping_cart import JSONStorage, ShoppingCartApp
+
+MENU = "Enter your choice"
+OPTIONAL_ANSWERS = {"Continue with checkout?": "yes", "Press Enter to see older orders, or q to go back": "q"}
+DEFAULT_MIX = {"browse": 4, "search": 1, "add_to_cart": 4, "view_cart": 2, "checkout": 1, "history": 0.5,
+               "admin_edit": 0.1}
+
+
+class ScriptError(Exception):
+    pass
+
+
+def prompt_key(prompt):
+    return prompt.split("(")[0].strip().rstrip(":").strip()
+
+
+def step(action, *inputs):
+    return {"action": action, "inputs": [list(entry) for entry in inputs]}
+
+
+class ScriptedInput:
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.step = -1
+        self.position = 0
+        self.started = None
+        self.timings = []
+
+    def __call__(self, prompt=""):
+        key = prompt_key(prompt)
+        while True:
+            inputs = self.steps[self.step]["inputs"] if self.step >= 0 else []
+            if self.position < len(inputs) and inputs[self.position][0] == key:
+                self.position += 1
+                if self.position == 1:
+                    self.started = time.perf_counter()
+                return inputs[self.position - 1][1]
+            if key in OPTIONAL_ANSWERS:
+                return OPTIONAL_ANSWERS[key]
+            if key != MENU:
+                raise ScriptError(f"unexpected prompt {prompt.strip()!r} in step {self.step}")
+            self.finish_step()
+            if self.step + 1 >= len(self.steps):
+                raise ScriptError("script ended before the session did")
+            self.step += 1
+            self.position = 0
+
+    def finish_step(self):
+        if self.started is not None:
+            inputs = self.steps[self.step]["inputs"]
+            self.timings.append((self.steps[self.step]["action"], time.perf_counter() - self.started,
+                                 self.position == len(inputs)))
+            self.started = None
+
+
+class SessionConsole:
+
+    def __init__(self):
+        self.local = threading.local()
+        self.stdout = sys.stdout
+        self.input = builtins.input
+
+    def __enter__(self):
+        sys.stdout = self
+        builtins.input = self.read
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.stdout = self.stdout
+        builtins.input = self.input
+
+    def attach(self, feed, output):
+        self.local.feed = feed
+        self.local.output = output
+
+    def read(self, prompt=""):
+        feed = getattr(self.local, "feed", None)
+        if feed is None:
+            return self.input(prompt)
+        self.write(prompt)
+        answer = feed(prompt)
+        self.write(answer + "\n")
+        return answer
+
+    def write(self, text):
+        output = getattr(self.local, "output", None)
+        if output is None:
+            return self.stdout.write(text)
+        output.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+
+def shopper_script(rng, username, product_ids, mix, actions, admin=("Maria", "maria123")):
+    password = "loadtest"
+    login = [(MENU, "2"), ("Username", username), ("Password", password)]
+    builders = {
+        "browse": lambda: step("browse", (MENU, "1"), ("Enter a page number, a sort key", str(rng.randint(1, 50))),
+                               ("Enter a page number, a sort key", "")),
+        "search": lambda: step("search", (MENU, "10"), ("Search for", rng.choice(NOUNS))),
+        "add_to_cart": lambda: step("add_to_cart", *add_to_cart()),
+        "view_cart": lambda: step("view_cart", (MENU, "3")),
+        "checkout": lambda: step("checkout", *add_to_cart(), (MENU, "7"), ("Credit Card Number", "4111111111111"),
+                                 ("Expiry Date", "1230"), ("CVV", "123"), ("Is the above address correct?", "yes"),
+                                 ("Please provide your feedback on our service", "Load test order")),
+        "history": lambda: step("history", (MENU, "8")),
+        "admin_edit": lambda: step("admin_edit", (MENU, "9"), (MENU, "3"), ("Admin Username", admin[0]),
+                                   ("Admin Password", admin[1]), (MENU, "4"),
+                                   ("Enter product ID to modify", str(rng.choice(product_ids))), ("Enter new name", ""),
+                                   ("Enter new price", str(round(rng.uniform(5, 2000), 2))),
+                                   ("Enter new description", ""), ("Enter new stock quantity", ""), (MENU, "5"),
+                                   *login)
+    }
+
+    def add_to_cart():
+        return (MENU, "2"), ("Enter product ID", str(rng.choice(product_ids))), ("Enter quantity", str(rng.randint(1, 3)))
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    steps = [step("register", (MENU, "1"), ("First Name", "Load"), ("Last Name", "Test"),
+                  ("Address", "1 Test Street"), ("Username", username), ("Password", password)),
+             step("login", *login)]
+    steps.extend(builders[rng.choices(names, weights)[0]]() for _ in range(actions))
+    steps.append(step("logout", (MENU, "9")))
+    steps.append(step("exit", (MENU, "4")))
+    return {"name": username, "steps": steps}
+
+
+def run_session(app, console, script):
+    feed = ScriptedInput(script["steps"])
+    output = []
+    console.attach(feed, output)
+    try:
+        app.session().run_menu()
+    finally:
+        console.attach(None, None)
+    feed.finish_step()
+    text = "".join(output)
+    errors = [line for line in text.splitlines() if line.startswith("Error")]
+    return feed.timings, errors, text
+
+
+def stock_edits(scripts):
+    edited = set()
+    for script in scripts:
+        product_id = None
+        for entry in (entry for s in script["steps"] for entry in s["inputs"]):
+            if entry[0] in ("Enter product ID to modify", "Enter product ID to remove"):
+                product_id = int(entry[1]) if entry[1].isdigit() else None
+                if entry[0] == "Enter product ID to remove":
+                    edited.add(product_id)
+            elif entry[0] == "Enter new stock quantity" and entry[1]:
+                edited.add(product_id)
+    return edited
+
+
+def run_load(app, scripts, concurrency=None, keep_output=False):
+    committed = {}
+    lock = threading.Lock()
+
+    def record_commits(holds):
+        with lock:
+            for hold in holds:
+                committed[hold.product.product_id] = committed.get(hold.product.product_id, 0) + hold.quantity
+
+    edited = stock_edits(scripts)
+    initial = {p.product_id: p.stock for p in app.products}
+    app.inventory.listeners.append(record_commits)
+    start = time.perf_counter()
+    try:
+        with SessionConsole() as console, ThreadPoolExecutor(concurrency or len(scripts)) as pool:
+            results = list(pool.map(lambda script: run_session(app, console, script), scripts))
+    finally:
+        app.inventory.listeners.remove(record_commits)
+    seconds = time.perf_counter() - start
+
+    timings = {}
+    incomplete = {}
+    errors = []
+    for session_timings, session_errors, _ in results:
+        errors.extend(session_errors)
+        for action, elapsed, completed in session_timings:
+            timings.setdefault(action, []).append(elapsed)
+            if not completed:
+                incomplete[action] = incomplete.get(action, 0) + 1
+    held = app.inventory.held()
+    negative = [(p.product_id, p.stock) for p in app.products if p.stock < 0]
+    drift = []
+    for product_id, stock in initial.items():
+        product = app.products.get(product_id)
+        if product is None or product_id in edited:
+            continue
+        accounted = product.stock + held.get(product_id, 0) + committed.get(product_id, 0)
+        if accounted != stock:
+            drift.append({"product_id": product_id, "initial": stock, "stock": product.stock,
+                          "held": held.get(product_id, 0), "committed": committed.get(product_id, 0)})
+    steps = sum(len(values) for values in timings.values())
+    report = {
+        "sessions": len(scripts),
+        "failed_sessions": sum(1 for _, session_errors, _ in results if session_errors),
+        "steps": steps,
+        "seconds": seconds,
+        "steps_per_second": steps / seconds if seconds else 0.0,
+        "actions": {action: dict(summarize(values), incomplete=incomplete.get(action, 0))
+                    for action, values in sorted(timings.items())},
+        "errors": len(errors),
+        "first_errors": errors[:10],
+        "consistency": {"negative_stock": negative, "stock_drift": drift[:10], "drifted_products": len(drift)}
+    }
+    if keep_output:
+        report["output"] = [text for _, _, text in results]
+    return report
+
+
+def record_session(app, path):
+    steps = []
+
+    def read(prompt=""):
+        answer = original(prompt)
+        if prompt_key(prompt) == MENU:
+            steps.append(step(f"choice {answer}"))
+        if steps:
+            steps[-1]["inputs"].append([prompt_key(prompt), answer])
+        return answer
+
+    original = builtins.input
+    builtins.input = read
+    try:
+        app.main_menu()
+    finally:
+        builtins.input = original
+        with open(path, "w") as file:
+            json.dump({"name": os.path.splitext(os.path.basename(path))[0], "steps": steps}, file, indent=4)
+    return steps
+
+
+def open_app(directory, products, seed):
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix="loadtest-")
+        write_dataset(directory, generate_catalog(products, seed), [], [])
+    app = ShoppingCartApp(JSONStorage(directory))
+    app.load_recommendations()
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record, replay and load test scripted menu sessions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="run the menus interactively and save the inputs as a script")
+    record.add_argument("script")
+    replay = commands.add_parser("replay", help="replay recorded scripts, each by several concurrent sessions")
+    replay.add_argument("scripts", nargs="+")
+    replay.add_argument("--copies", type=int, default=1)
+    load = commands.add_parser("load", help="run generated shoppers with a mix of actions")
+    load.add_argument("--shoppers", type=int, default=20)
+    load.add_argument("--actions", type=int, default=30, help="actions per shopper")
+    load.add_argument("--mix", default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+                      help="comma-separated action=weight pairs")
+    load.add_argument("--products", type=int, default=1000, help="catalog size when no directory is given")
+    load.add_argument("--seed", type=int, default=0)
+    for command in (record, replay, load):
+        command.add_argument("--directory", help="store to run against (default: a new generated store)")
+    for command in (replay, load):
+        command.add_argument("--concurrency", type=int)
+        command.add_argument("--output", help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    app = open_app(args.directory, getattr(args, "products", 1000), getattr(args, "seed", 0))
+    if args.command == "record":
+        record_session(app, args.script)
+        raise SystemExit
+    if args.command == "replay":
+        scripts = []
+        for path in args.scripts:
+            with open(path, "r") as file:
+                scripts.extend([json.load(file)] * args.copies)
+    else:
+        rng = random.Random(args.seed)
+        mix = {name: float(weight) for name, weight in (pair.split("=") for pair in args.mix.split(","))}
+        product_ids = [p.product_id for p in app.products]
+        scripts = [shopper_script(rng, f"shopper-{args.seed}-{number}", product_ids, mix, args.actions)
+                   for number in range(args.shoppers)]
+    try:
+        report = run_load(app, scripts, args.concurrency)
+    finally:
+        app.close()
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
@@ -0,0 +1,181 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from online_shopping_cart import ShoppingCartApp, User
+
+prices = {}
+
+
+def load_prices(catalog_prices):
+    global prices
+    prices = catalog_prices
+
+
+def prepare_orders(lines):
+    return [prepare_order(line) for line in lines]
+
+
+def prepare_order(line):
+    try:
+        order = json.loads(line)
+        lines = {}
+        for item in order['items']:
+            lines[int(item['product_id'])] = lines.get(int(item['product_id']), 0) + int(item['quantity'])
+        username = order['username']
+        date = order.get('date')
+        card = (str(order['card_number']), str(order['expiry_date']), str(order['cvv']))
+        feedback = str(order.get('feedback', ""))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None, "Malformed order."
+    if not isinstance(username, str):
+        return None, "Malformed order."
+    if not lines:
+        return None, "Empty order."
+    if date is not None:
+        try:
+            datetime.datetime.fromisoformat(date)
+        except (TypeError, ValueError):
+            return None, "Invalid date."
+    error = User.payment_error(*card)
+    if error:
+        return None, error
+    if any(product_id not in prices for product_id in lines):
+        return None, "Product not found."
+    if any(quantity <= 0 for quantity in lines.values()):
+        return None, "Invalid quantity."
+    lines = [(product_id, quantity, prices[product_id]) for product_id, quantity in lines.items()]
+    items = [(name, quantity, price * quantity) for _, quantity, (name, price) in lines]
+    return (username, lines, items, feedback), None
+
+
+class BulkCheckout:
+
+    def __init__(self, app, workers=None, batch_size=10000):
+        self.app = app
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def run(self, path):
+        reports = []
+        catalog_prices = {product.product_id: (product.name, product.price) for product in self.app.products}
+        with ProcessPoolExecutor(self.workers, initializer=load_prices, initargs=(catalog_prices,)) as pool, \
+                open(path, "r") as file:
+            batch = []
+            for line in file:
+                if line.strip():
+                    batch.append(line)
+                if len(batch) >= self.batch_size:
+                    reports.append(self.process_batch(pool, batch, len(reports) + 1))
+                    batch = []
+            if batch:
+                reports.append(self.process_batch(pool, batch, len(reports) + 1))
+        return reports
+
+    def process_batch(self, pool, lines, number):
+        start = time.perf_counter()
+        rejections = {}
+        size = -(-len(lines) // (self.workers * 4))
+        chunks = [lines[offset:offset + size] for offset in range(0, len(lines), size)]
+        partitions = [[] for _ in range(self.workers)]
+        cross_partition = []
+        for chunk in pool.map(prepare_orders, chunks):
+            for order, error in chunk:
+                if error:
+                    rejections[error] = rejections.get(error, 0) + 1
+                    continue
+                owners = {product_id % self.workers for product_id, _, _ in order[1]}
+                if len(owners) == 1:
+                    partitions[owners.pop()].append(order)
+                else:
+                    cross_partition.append(order)
+        accepted = 0
+        for partition in partitions + [cross_partition]:
+            if partition:
+                accepted += self.commit_partition(partition, rejections)
+        seconds = time.perf_counter() - start
+        return {
+            "batch": number,
+            "orders": len(lines),
+            "accepted": accepted,
+            "rejected": len(lines) - accepted,
+            "rejections": rejections,
+            "seconds": seconds,
+            "orders_per_second": len(lines) / seconds if seconds else 0.0
+        }
+
+    def commit_partition(self, orders, rejections):
+        reserved = []
+        for order in orders:
+            user = self.app.users.get(order[0])
+            if user is None:
+                error = "Unknown user."
+            else:
+                holds, items, error = self.reserve(order[1])
+            if error:
+                rejections[error] = rejections.get(error, 0) + 1
+                continue
+            reserved.append([user, holds, items or order[2], order[3]])
+        while reserved:
+            failed = self.app.inventory.commit_all([hold for order in reserved for hold in order[1]])
+            if not failed:
+                break
+            failed = {hold.reservation_id for hold in failed}
+            for order in list(reserved):
+                for position, hold in enumerate(order[1]):
+                    if hold.reservation_id not in failed:
+                        continue
+                    replacement = self.app.inventory.reserve(hold.product, hold.quantity)
+                    if replacement is None:
+                        self.app.inventory.release_many(order[1])
+                        reserved.remove(order)
+                        rejections["Insufficient stock."] = rejections.get("Insufficient stock.", 0) + 1
+                        break
+                    order[1][position] = replacement
+        date = datetime.datetime.now().isoformat()
+        for user, _, items, feedback in reserved:
+            user.order_history.add_purchase({
+                "date": date,
+                "items": items,
+                "total_price": round(sum(item[2] for item in items), 2),
+                "feedback": feedback
+            })
+        return len(reserved)
+
+    def reserve(self, lines):
+        holds = []
+        items = []
+        repriced = False
+        for product_id, quantity, (name, price) in lines:
+            product = self.app.products.get(product_id)
+            if product is None:
+                self.app.inventory.release_many(holds)
+                return None, None, "Product not found."
+            hold = self.app.inventory.reserve(product, quantity)
+            if hold is None:
+                self.app.inventory.release_many(holds)
+                return None, None, "Insufficient stock."
+            holds.append(hold)
+            items.append((product.name, quantity, product.price * quantity))
+            repriced = repriced or (product.name, product.price) != (name, price)
+        return holds, items if repriced else None, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check out orders from a JSONL file.")
+    parser.add_argument("orders", help="JSONL file with one order per line")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+    app = ShoppingCartApp()
+    try:
+        for report in BulkCheckout(app, args.workers, args.batch_size).run(args.orders):
+            print(f"Batch {report['batch']}: {report['accepted']} accepted, {report['rejected']} rejected "
+                  f"in {report['seconds']:.2f}s ({report['orders_per_second']:.0f} orders/s)")
+            for reason, count in report['rejections'].items():
+                print(f"    {reason} {count}")
+    finally:
+        app.close()
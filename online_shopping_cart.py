@@ -1,12 +1,161 @@
+import array
+import bisect
+import copy
+import csv
 import datetime
+import functools
+import heapq
+import itertools
+import math
+import mmap
 import os
 import json
+import queue
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+import zlib
 from abc import ABC, abstractmethod
-from tabulate import tabulate
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import ExitStack, contextmanager
+
+
+class Metrics:
+
+    LATENCY_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+    SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 10000)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0, 0]
+            histogram[1][bisect.bisect_left(buckets, value)] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def gauge(self, name, value, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def timed(self, operation):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe("shop_operation_seconds", time.perf_counter() - start, operation=operation)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h[0], list(h[1]), h[2], h[3]) for key, h in self._histograms.items()}
+        gauges = {key: value() if callable(value) else value for key, value in self._gauges.items()}
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                       for (name, labels), value in sorted(gauges.items())],
+            "histograms": [{
+                "name": name,
+                "labels": dict(labels),
+                "buckets": dict(zip([str(b) for b in buckets] + ["+Inf"], itertools.accumulate(counts))),
+                "sum": total,
+                "count": count
+            } for (name, labels), (buckets, counts, total, count) in sorted(histograms.items())]
+        }
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for kind, metrics in (("counter", snapshot['counters']), ("gauge", snapshot['gauges'])):
+            for metric in metrics:
+                if metric['name'] not in typed:
+                    typed.add(metric['name'])
+                    lines.append(f"# TYPE {metric['name']} {kind}")
+                lines.append(f"{metric['name']}{self._labels(metric['labels'])} {metric['value']}")
+        for metric in snapshot['histograms']:
+            if metric['name'] not in typed:
+                typed.add(metric['name'])
+                lines.append(f"# TYPE {metric['name']} histogram")
+            for bound, count in metric['buckets'].items():
+                labels = self._labels(dict(metric['labels'], le=bound))
+                lines.append(f"{metric['name']}_bucket{labels} {count}")
+            lines.append(f"{metric['name']}_sum{self._labels(metric['labels'])} {metric['sum']}")
+            lines.append(f"{metric['name']}_count{self._labels(metric['labels'])} {metric['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        if path.endswith(".prom"):
+            with open(path, "w") as file:
+                file.write(self.prometheus())
+        else:
+            with open(path, "w") as file:
+                json.dump(self.snapshot(), file, indent=4)
+
+    def dump_on_signal(self, path, signum=getattr(signal, "SIGUSR1", None)):
+        if signum is not None:
+            signal.signal(signum, lambda *_: threading.Thread(target=self.dump, args=(path,), daemon=True).start())
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+        return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+METRICS = Metrics(enabled=os.environ.get("SHOP_METRICS") == "1")
+
+
+def render_table(rows, headers):
+    from tabulate import tabulate
+    if not METRICS.enabled:
+        return tabulate(rows, headers=headers, tablefmt="grid")
+    start = time.perf_counter()
+    text = tabulate(rows, headers=headers, tablefmt="grid")
+    METRICS.observe("shop_operation_seconds", time.perf_counter() - start, operation="render_table")
+    METRICS.observe("shop_table_rows", len(rows), buckets=Metrics.SIZE_BUCKETS)
+    return text
 
 
 class Product:
 
+    __slots__ = ("product_id", "name", "price", "description", "stock")
+
     def __init__(self, product_id, name, price, description, stock):
         self.product_id = product_id
         self.name = name
@@ -14,13 +163,13 @@ class Product:
         self.description = description
         self.stock = stock
 
-    def to_dict(self):
+    def to_dict(self, held=0):
         return {
             "product_id": self.product_id,
             "name": self.name,
             "price": self.price,
             "description": self.description,
-            "stock": self.stock
+            "stock": self.stock + held
         }
 
     @staticmethod
@@ -34,86 +183,1637 @@ class Product:
         )
 
 
-class Cart:
+class ProductView(Product):
+
+    __slots__ = ("_store", "_product_id", "_row", "_generation")
+
+    def __init__(self, store, product_id, row):
+        self._store = store
+        self._product_id = product_id
+        self._row = row
+        self._generation = store.generation
+
+    def __repr__(self):
+        return f"ProductView({self._product_id})"
+
+    def row(self):
+        if self._generation != self._store.generation:
+            self._row = self._store.find(self._product_id)
+            self._generation = self._store.generation
+        if self._row is None or not self._store.alive[self._row]:
+            return None
+        return self._row
+
+    def _removed(self):
+        return self._store.removed[self._product_id]
+
+    @property
+    def product_id(self):
+        return self._product_id
+
+    @property
+    def name(self):
+        row = self.row()
+        if row is None:
+            return self._removed().name
+        return self._store.text(self._store.name_offsets, self._store.name_lengths, row)
+
+    @name.setter
+    def name(self, value):
+        row = self.row()
+        if row is None:
+            self._removed().name = value
+            return
+        self._store.set_text(self._store.name_offsets, self._store.name_lengths, row, value)
+        self._store.reclaim()
+
+    @property
+    def price(self):
+        row = self.row()
+        return self._removed().price if row is None else self._store.prices[row]
+
+    @price.setter
+    def price(self, value):
+        row = self.row()
+        if row is None:
+            self._removed().price = value
+        else:
+            self._store.prices[row] = value
+
+    @property
+    def description(self):
+        row = self.row()
+        if row is None:
+            return self._removed().description
+        return self._store.text(self._store.description_offsets, self._store.description_lengths, row)
+
+    @description.setter
+    def description(self, value):
+        row = self.row()
+        if row is None:
+            self._removed().description = value
+            return
+        self._store.set_text(self._store.description_offsets, self._store.description_lengths, row, value)
+        self._store.reclaim()
+
+    @property
+    def stock(self):
+        row = self.row()
+        return self._removed().stock if row is None else self._store.stock[row]
+
+    @stock.setter
+    def stock(self, value):
+        row = self.row()
+        if row is None:
+            self._removed().stock = value
+        else:
+            self._store.stock[row] = value
+
+
+class CompactProductStore:
+
+    INTERN_LIMIT = 65536
+    MERGE_MIN = 4096
+    VACUUM_MIN = 1 << 20
 
     def __init__(self):
-        self.items = []
+        self.generation = 0
+        self.ids = array.array("q")
+        self.prices = array.array("d")
+        self.stock = array.array("q")
+        self.alive = bytearray()
+        self.name_offsets = array.array("q")
+        self.name_lengths = array.array("I")
+        self.description_offsets = array.array("q")
+        self.description_lengths = array.array("I")
+        self.strings = bytearray()
+        self.removed = {}
+        self._interned = {}
+        self._count = 0
+        self._sorted_rows = 0
+        self._tail = {}
+        self._dead_bytes = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, product_id):
+        return self.row_of(product_id) is not None
+
+    @classmethod
+    def from_columns(cls, columns):
+        store = cls()
+        for name in ("ids", "prices", "stock", "name_offsets", "name_lengths", "description_offsets",
+                     "description_lengths"):
+            setattr(store, name, columns[name])
+        store.strings = bytearray(columns['strings'])
+        store.alive = bytearray(b"\x01") * len(store.ids)
+        store._count = store._sorted_rows = len(store.ids)
+        return store
+
+    def __getitem__(self, product_id):
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return product
+
+    def __setitem__(self, product_id, product):
+        row = self.find(product_id)
+        if row is None:
+            row = len(self.ids)
+            if self._tail or (row and self.ids[-1] > product_id):
+                self._tail[product_id] = row
+            else:
+                self._sorted_rows = row + 1
+            for column, value in ((self.ids, product_id), (self.prices, 0.0), (self.stock, 0),
+                                  (self.name_offsets, 0), (self.name_lengths, 0),
+                                  (self.description_offsets, 0), (self.description_lengths, 0)):
+                column.append(value)
+            self.alive.append(0)
+        if not self.alive[row]:
+            self.alive[row] = 1
+            self._count += 1
+        self.prices[row] = product.price
+        self.stock[row] = product.stock
+        self.set_text(self.name_offsets, self.name_lengths, row, product.name)
+        self.set_text(self.description_offsets, self.description_lengths, row, product.description)
+        self.removed.pop(product_id, None)
+        if len(self._tail) > max(self.MERGE_MIN, self._sorted_rows // 2):
+            self.merge()
+        self.reclaim()
+
+    def get(self, product_id, default=None):
+        row = self.row_of(product_id)
+        return default if row is None else ProductView(self, product_id, row)
+
+    def pop(self, product_id, default=None):
+        row = self.row_of(product_id)
+        if row is None:
+            return default
+        self.removed[product_id] = Product(
+            product_id,
+            self.text(self.name_offsets, self.name_lengths, row),
+            self.prices[row],
+            self.text(self.description_offsets, self.description_lengths, row),
+            self.stock[row]
+        )
+        self.alive[row] = 0
+        self._count -= 1
+        return ProductView(self, product_id, row)
+
+    def values(self):
+        self.merge()
+        for row, product_id in enumerate(self.ids):
+            if self.alive[row]:
+                yield ProductView(self, product_id, row)
+
+    def find(self, product_id):
+        row = bisect.bisect_left(self.ids, product_id, 0, self._sorted_rows)
+        if row < self._sorted_rows and self.ids[row] == product_id:
+            return row
+        return self._tail.get(product_id)
+
+    def merge(self):
+        if not self._tail:
+            return
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        for name in ("ids", "prices", "stock", "name_offsets", "name_lengths", "description_offsets",
+                     "description_lengths"):
+            column = getattr(self, name)
+            setattr(self, name, array.array(column.typecode, [column[row] for row in order]))
+        self.alive = bytearray(self.alive[row] for row in order)
+        self._tail = {}
+        self._sorted_rows = len(self.ids)
+        self.generation += 1
+
+    def row_of(self, product_id):
+        row = self.find(product_id)
+        return row if row is not None and self.alive[row] else None
+
+    def text(self, offsets, lengths, row):
+        offset = offsets[row]
+        return self.strings[offset:offset + lengths[row]].decode()
+
+    def set_text(self, offsets, lengths, row, value):
+        encoded = value.encode()
+        old_offset, old_length = offsets[row], lengths[row]
+        old = self.strings[old_offset:old_offset + old_length]
+        if old == encoded:
+            return
+        if old_length and self._interned.get(bytes(old)) != old_offset:
+            self._dead_bytes += old_length
+        offset = self._interned.get(encoded)
+        if offset is None:
+            offset = len(self.strings)
+            self.strings += encoded
+            if len(self._interned) < self.INTERN_LIMIT:
+                self._interned[encoded] = offset
+        offsets[row] = offset
+        lengths[row] = len(encoded)
+
+    def reclaim(self):
+        if self._dead_bytes > max(self.VACUUM_MIN, len(self.strings) // 2):
+            self.vacuum()
+
+    def vacuum(self):
+        self.merge()
+        live = [row for row in range(len(self.ids)) if self.alive[row]]
+        texts = [(self.text(self.name_offsets, self.name_lengths, row),
+                  self.text(self.description_offsets, self.description_lengths, row)) for row in live]
+        for name in ("ids", "prices", "stock"):
+            column = getattr(self, name)
+            setattr(self, name, array.array(column.typecode, (column[row] for row in live)))
+        self.alive = bytearray(b"\x01" * len(live))
+        for name in ("name_offsets", "name_lengths", "description_offsets", "description_lengths"):
+            setattr(self, name, array.array(getattr(self, name).typecode, [0]) * len(live))
+        self.strings = bytearray()
+        self._interned = {}
+        self._dead_bytes = 0
+        self._sorted_rows = len(live)
+        for row, (name, description) in enumerate(texts):
+            self.set_text(self.name_offsets, self.name_lengths, row, name)
+            self.set_text(self.description_offsets, self.description_lengths, row, description)
+        self.generation += 1
+
+
+class ProductSearchIndex:
+
+    TOKEN = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, name_weight=2, prefix_weight=0.5, max_expansions=50):
+        self.name_weight = name_weight
+        self.prefix_weight = prefix_weight
+        self.max_expansions = max_expansions
+        self._postings = {}
+        self._terms = {}
+        self._vocabulary = []
+
+    def __len__(self):
+        return len(self._terms)
 
-    def add_to_cart(self, product, quantity):
-        if product.stock >= quantity:
-            self.items.append((product, quantity))
+    @staticmethod
+    def tokenize(text):
+        return ProductSearchIndex.TOKEN.findall(text.lower())
+
+    def add(self, product):
+        terms = {}
+        for token in self.tokenize(product.name):
+            terms[token] = terms.get(token, 0) + self.name_weight
+        for token in self.tokenize(product.description):
+            terms[token] = terms.get(token, 0) + 1
+        self._terms[product.product_id] = terms
+        for token, weight in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[product.product_id] = weight
+
+    def remove(self, product_id):
+        for token in self._terms.pop(product_id, ()):
+            postings = self._postings[token]
+            del postings[product_id]
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def search(self, query, k=10):
+        scores = {}
+        total = len(self._terms)
+        for term in set(self.tokenize(query)):
+            matched = {}
+            for token, weight in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + total / len(postings))
+                for product_id, tf in postings.items():
+                    score = weight * tf * idf
+                    if score > matched.get(product_id, 0):
+                        matched[product_id] = score
+            for product_id, score in matched.items():
+                scores[product_id] = scores.get(product_id, 0) + score
+        return heapq.nlargest(k, scores, key=lambda product_id: (scores[product_id], -product_id))
+
+    def _expand(self, term):
+        expansions = []
+        if term in self._postings:
+            expansions.append((term, 1))
+        start = bisect.bisect_right(self._vocabulary, term)
+        for token in itertools.islice(self._vocabulary, start, start + self.max_expansions):
+            if not token.startswith(term):
+                break
+            expansions.append((token, self.prefix_weight))
+        return expansions
+
+
+class ProductCatalog:
+
+    SORT_KEYS = ("id", "price", "name")
+    FIELDS = ("name", "price", "description", "stock")
+    ITER_CHUNK = 1024
+
+    def __init__(self, products=(), compact=False):
+        self.version = 0
+        self.on_change = None
+        self.listeners = []
+        self._versions = {}
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._by_id = CompactProductStore() if compact else {}
+        self._ids = array.array("q")
+        self._by_price = array.array("q")
+        self._by_name = array.array("q")
+        self._search = None
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._indexed = threading.Condition(self._lock)
+        self._stale = False
+        self.extend(products)
+
+    @classmethod
+    def restore(cls, products, ids, by_price, by_name):
+        catalog = cls()
+        catalog._by_id = products
+        catalog._ids = ids
+        catalog._by_price = by_price
+        catalog._by_name = by_name
+        catalog._next_id = ids[-1] + 1 if ids else 1
+        return catalog
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        with self._lock:
+            product_ids = array.array("q", self._ids)
+        for start in range(0, len(product_ids), self.ITER_CHUNK):
+            with self._lock:
+                products = [self._by_id.get(product_id) for product_id in product_ids[start:start + self.ITER_CHUNK]]
+            yield from (product for product in products if product is not None)
+
+    def __contains__(self, product_id):
+        return product_id in self._by_id
+
+    def get(self, product_id):
+        return self._by_id.get(product_id)
+
+    def next_id(self):
+        with self._lock:
+            product_id = self._next_id
+            self._next_id += 1
+            return product_id
+
+    def add(self, product):
+        with self._lock:
+            self._wait_indexed()
+            if product.product_id in self._by_id:
+                raise ValueError(f"Product ID {product.product_id} already exists.")
+            self._by_id[product.product_id] = product
+            product = self._by_id[product.product_id]
+            self._next_id = max(self._next_id, product.product_id + 1)
+            bisect.insort(self._ids, product.product_id)
+            self._index(product)
+            self.version += 1
+            self.mark_dirty([product.product_id])
+            return product
+
+    def extend(self, products):
+        with self._lock:
+            self._wait_indexed()
+            added = array.array("q")
+            for product in products:
+                if product.product_id in self._by_id:
+                    raise ValueError(f"Product ID {product.product_id} already exists.")
+                self._by_id[product.product_id] = product
+                added.append(product.product_id)
+            if not added:
+                return 0
+            self._next_id = max(self._next_id, max(added) + 1)
+            self._reindex(added)
+            self.version += 1
+            return len(added)
+
+    def upsert_many(self, products, chunk_size=10000):
+        inserted = updated = 0
+        added = None
+        products = iter(products)
+        try:
+            while True:
+                chunk = list(itertools.islice(products, chunk_size))
+                if not chunk:
+                    break
+                with self._lock:
+                    if added is None:
+                        self._wait_indexed()
+                        if len(chunk) * 4 >= len(self._by_id):
+                            added = array.array("q")
+                            self._stale = True
+                    counts = self._upsert_chunk(chunk, added)
+                inserted, updated = inserted + counts[0], updated + counts[1]
+        finally:
+            if added is not None:
+                with self._lock:
+                    self._reindex(added)
+                    self._stale = False
+                    self._indexed.notify_all()
+        if inserted or updated:
+            self.mark_dirty(None)
+        return inserted, updated
+
+    def _upsert_chunk(self, chunk, added=None):
+        inserted = updated = 0
+        for product in chunk:
+            current = self._by_id.get(product.product_id)
+            if current is None:
+                self._by_id[product.product_id] = product
+                self._next_id = max(self._next_id, product.product_id + 1)
+                inserted += 1
+                if added is not None:
+                    added.append(product.product_id)
+                else:
+                    bisect.insort(self._ids, product.product_id)
+                    self._index(self._by_id[product.product_id])
+                continue
+            changes = {field: getattr(current, field) for field in self.FIELDS
+                       if getattr(current, field) != getattr(product, field)}
+            if added is None:
+                self._unindex(current)
+            for field in changes:
+                setattr(current, field, getattr(product, field))
+            if added is None:
+                self._index(current)
+            if changes:
+                self._publish("update", current, changes)
+            updated += 1
+        self.version += 1
+        return inserted, updated
+
+    def mark_dirty(self, product_ids):
+        with self._dirty_lock:
+            if product_ids is None or self._dirty is None:
+                self._dirty = None
+            else:
+                self._dirty.update(product_ids)
+        if self.on_change:
+            self.on_change()
+
+    def take_dirty(self):
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
+    def product_version(self, product_id):
+        return self._versions.get(product_id, 0)
+
+    def _publish(self, kind, product, changes):
+        self._versions[product.product_id] = self._versions.get(product.product_id, 0) + 1
+        for listener in self.listeners:
+            listener(kind, product, changes)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._wait_indexed()
+            product = self._by_id.get(product_id)
+            if product:
+                del self._ids[bisect.bisect_left(self._ids, product_id)]
+                self._unindex(product)
+                self._by_id.pop(product_id)
+                self.version += 1
+                self.mark_dirty([product_id])
+                self._publish("remove", product, {})
+            return product
+
+    def update(self, product, name=None, price=None, description=None, stock=None):
+        with self._lock:
+            self._wait_indexed()
+            self.version += 1
+            self._unindex(product)
+            changes = {}
+            for field, value in (("name", name), ("price", price), ("description", description), ("stock", stock)):
+                if value is not None and getattr(product, field) != value:
+                    changes[field] = getattr(product, field)
+                    setattr(product, field, value)
+            self._index(product)
+            self.mark_dirty([product.product_id])
+            if changes:
+                self._publish("update", product, changes)
+
+    def by_price_range(self, low, high):
+        with self._lock:
+            self._wait_indexed()
+            start = bisect.bisect_left(self._by_price, (low,), key=self._price_key)
+            end = bisect.bisect_right(self._by_price, (high, float("inf")), key=self._price_key)
+            return [self._by_id[product_id] for product_id in self._by_price[start:end]]
+
+    def by_name_prefix(self, prefix):
+        with self._lock:
+            self._wait_indexed()
+            prefix = prefix.lower()
+            matches = []
+            start = bisect.bisect_left(self._by_name, (prefix,), key=self._name_key)
+            for product_id in itertools.islice(self._by_name, start, None):
+                product = self._by_id[product_id]
+                if not product.name.lower().startswith(prefix):
+                    break
+                matches.append(product)
+            return matches
+
+    def search(self, query, k=10):
+        with self._lock:
+            self._wait_indexed()
+            if self._search is None:
+                self._search = ProductSearchIndex()
+                for product in self._by_id.values():
+                    self._search.add(product)
+            return [self._by_id[product_id] for product_id in self._search.search(query, k)]
+
+    def page(self, offset, limit, sort="id", descending=False):
+        with self._lock:
+            if sort != "id":
+                self._wait_indexed()
+            if sort == "price":
+                product_ids = self._sorted_slice(self._by_price, offset, limit, descending)
+            elif sort == "name":
+                product_ids = self._sorted_slice(self._by_name, offset, limit, descending)
+            elif sort == "id":
+                product_ids = self._sorted_slice(self._ids, offset, limit, descending)
+            else:
+                raise ValueError(f"Unknown sort key: {sort}")
+            return [self._by_id[product_id] for product_id in product_ids]
+
+    @staticmethod
+    def _sorted_slice(index, offset, limit, descending):
+        if not descending:
+            return index[offset:offset + limit]
+        end = max(len(index) - offset, 0)
+        return index[max(end - limit, 0):end][::-1]
+
+    def _wait_indexed(self):
+        while self._stale:
+            self._indexed.wait()
+
+    def _reindex(self, added):
+        self._ids = array.array("q", sorted(itertools.chain(self._ids, added)))
+        self._by_price = array.array("q", sorted(self._ids, key=self._price_key))
+        self._by_name = array.array("q", sorted(self._ids, key=self._name_key))
+        self._search = None
+
+    def _price_key(self, product_id):
+        return (self._by_id[product_id].price, product_id)
+
+    def _name_key(self, product_id):
+        return (self._by_id[product_id].name.lower(), product_id)
+
+    def _index(self, product):
+        bisect.insort(self._by_price, product.product_id, key=self._price_key)
+        bisect.insort(self._by_name, product.product_id, key=self._name_key)
+        if self._search is not None:
+            self._search.add(product)
+
+    def _unindex(self, product):
+        del self._by_price[bisect.bisect_left(self._by_price, self._price_key(product.product_id), key=self._price_key)]
+        del self._by_name[bisect.bisect_left(self._by_name, self._name_key(product.product_id), key=self._name_key)]
+        if self._search is not None:
+            self._search.remove(product.product_id)
+
+
+class CatalogFeed:
+
+    FIELDS = ("product_id", "name", "price", "description", "stock")
+
+    def __init__(self, path):
+        self.path = path
+        self.format = "csv" if path.lower().endswith(".csv") else "jsonl"
+        self.rejected = 0
+        self.errors = []
+
+    def __iter__(self):
+        self.rejected = 0
+        self.errors = []
+        with open(self.path, "r", newline="", encoding="utf-8") as file:
+            rows = csv.DictReader(file) if self.format == "csv" else file
+            for number, row in enumerate(rows, 2 if self.format == "csv" else 1):
+                try:
+                    if self.format == "jsonl":
+                        if not row.strip():
+                            continue
+                        row = json.loads(row)
+                    product = Product(int(row['product_id']), str(row['name']), float(row['price']),
+                                      str(row.get('description') or ""), int(row['stock']))
+                    if product.product_id <= 0 or product.price < 0 or product.stock < 0:
+                        raise ValueError("invalid product_id, price or stock")
+                except (KeyError, TypeError, ValueError) as e:
+                    self.rejected += 1
+                    if len(self.errors) < 10:
+                        self.errors.append(f"line {number}: {e}")
+                    continue
+                yield product
+            METRICS.inc("shop_bytes_read_total", os.path.getsize(self.path), operation="import_products")
+
+    def write(self, products):
+        count = 0
+        with open(self.path, "w", newline="", encoding="utf-8") as file:
+            if self.format == "csv":
+                writer = csv.writer(file)
+                writer.writerow(self.FIELDS)
+                for p in products:
+                    writer.writerow((p.product_id, p.name, p.price, p.description, p.stock))
+                    count += 1
+            else:
+                for p in products:
+                    file.write(json.dumps(p.to_dict()) + "\n")
+                    count += 1
+            METRICS.inc("shop_bytes_written_total", file.tell(), operation="export_products")
+        return count
+
+
+class Reservation:
+
+    def __init__(self, reservation_id, product, quantity, expires_at):
+        self.reservation_id = reservation_id
+        self.product = product
+        self.quantity = quantity
+        self.expires_at = expires_at
+        self.state = "held"
+
+
+class InventoryManager:
+
+    def __init__(self, hold_ttl=900, reap_interval=5, lock_stripes=64):
+        self.hold_ttl = hold_ttl
+        self.reap_interval = reap_interval
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._ids = itertools.count(1)
+        self._new_holds = queue.SimpleQueue()
+        self._expiry_heap = []
+        self._reap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+        self.listeners = []
+
+    def start(self):
+        if not self._reaper:
+            self._stop.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def stop(self):
+        if self._reaper:
+            self._stop.set()
+            self._reaper.join()
+            self._reaper = None
+
+    def reserve(self, product, quantity, ttl=None):
+        if quantity <= 0:
+            raise ValueError("Quantity must be a positive number.")
+        with self._lock_for(product.product_id):
+            if product.stock < quantity:
+                return None
             product.stock -= quantity
+        hold = Reservation(next(self._ids), product, quantity, time.monotonic() + (ttl or self.hold_ttl))
+        self._new_holds.put(hold)
+        return hold
+
+    def renew(self, hold, ttl=None):
+        with self._lock_for(hold.product.product_id):
+            if hold.state != "held":
+                return False
+            hold.expires_at = time.monotonic() + (ttl or self.hold_ttl)
+            return True
+
+    def release(self, hold):
+        with self._lock_for(hold.product.product_id):
+            return self._release(hold)
+
+    def release_many(self, holds):
+        return sum(1 for hold in holds if self.release(hold))
+
+    def withdraw(self, product, quantity):
+        with self._lock_for(product.product_id):
+            taken = max(0, min(product.stock, quantity))
+            product.stock -= taken
+        return taken
+
+    def restock(self, product, quantity):
+        with self._lock_for(product.product_id):
+            product.stock += quantity
+
+    def commit_many(self, holds):
+        committed = []
+        failed = []
+        stripes = {}
+        for hold in holds:
+            stripes.setdefault(self._stripe(hold.product.product_id), []).append(hold)
+        for stripe, group in stripes.items():
+            with self._locks[stripe]:
+                for hold in group:
+                    if hold.state == "held":
+                        hold.state = "committed"
+                        committed.append(hold)
+                    else:
+                        failed.append(hold)
+        if committed:
+            for listener in self.listeners:
+                listener(committed)
+        return failed
+
+    def commit_all(self, holds):
+        with ExitStack() as stack:
+            for stripe in sorted({self._stripe(hold.product.product_id) for hold in holds}):
+                stack.enter_context(self._locks[stripe])
+            failed = [hold for hold in holds if hold.state != "held"]
+            if failed:
+                return failed
+            for hold in holds:
+                hold.state = "committed"
+        if holds:
+            for listener in self.listeners:
+                listener(list(holds))
+        return []
+
+    def held(self):
+        held = {}
+        with self._reap_lock:
+            self._collect_new_holds()
+            for _, _, hold in self._expiry_heap:
+                if hold.state == "held":
+                    held[hold.product.product_id] = held.get(hold.product.product_id, 0) + hold.quantity
+        return held
+
+    def reap(self, now=None):
+        now = now or time.monotonic()
+        released = 0
+        with self._reap_lock:
+            self._collect_new_holds()
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, _, hold = heapq.heappop(self._expiry_heap)
+                if hold.state != "held":
+                    continue
+                with self._lock_for(hold.product.product_id):
+                    if hold.expires_at > now:
+                        heapq.heappush(self._expiry_heap, (hold.expires_at, hold.reservation_id, hold))
+                    elif self._release(hold):
+                        released += 1
+        return released
+
+    def _collect_new_holds(self):
+        while True:
+            try:
+                hold = self._new_holds.get_nowait()
+            except queue.Empty:
+                break
+            heapq.heappush(self._expiry_heap, (hold.expires_at, hold.reservation_id, hold))
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                METRICS.inc("shop_errors_total", operation="reap_reservations")
+                print(f"Error releasing expired reservations: {e}")
+
+    def _release(self, hold):
+        if hold.state != "held":
+            return False
+        hold.product.stock += hold.quantity
+        hold.state = "released"
+        return True
+
+    def _stripe(self, product_id):
+        return hash(product_id) % len(self._locks)
+
+    def _lock_for(self, product_id):
+        return self._locks[self._stripe(product_id)]
+
+
+class AlsoBought:
+
+    TOP_K = 10
+
+    def __init__(self):
+        self.version = 0
+        self.product_names = []
+        self._product_codes = {}
+        self._pairs = []
+        self._top = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.product_names)
+
+    @classmethod
+    @METRICS.timed("also_bought_load")
+    def load(cls, records, batch_size=100000):
+        engine = cls()
+        try:
+            import numpy as np
+        except ImportError:
+            for username, purchase in records:
+                engine.record(username, purchase)
+            return engine
+        counted = []
+        codes = []
+        sizes = []
+        for _, purchase in records:
+            basket = {engine.product_code(item[0]) for item in purchase['items']}
+            if len(basket) > 1:
+                codes.extend(basket)
+                sizes.append(len(basket))
+            if len(sizes) >= batch_size:
+                counted.append(cls._count_pairs(np, codes, sizes))
+                codes, sizes = [], []
+        if sizes:
+            counted.append(cls._count_pairs(np, codes, sizes))
+        if not counted:
+            return engine
+        keys = np.concatenate([keys for keys, _ in counted])
+        counts = np.concatenate([counts for _, counts in counted])
+        if len(counted) > 1:
+            keys, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        left = keys >> 32
+        right = keys & 0xFFFFFFFF
+        bounds = np.searchsorted(left, np.arange(len(engine.product_names) + 1)).tolist()
+        order = np.lexsort((right, -counts, left))
+        for code in range(len(engine.product_names)):
+            start, end = bounds[code], bounds[code + 1]
+            if start == end:
+                continue
+            engine._pairs[code] = dict(zip(right[start:end].tolist(), counts[start:end].tolist()))
+            top = order[start:min(end, start + cls.TOP_K)]
+            engine._top[code] = [list(entry) for entry in zip(counts[top].tolist(), right[top].tolist())]
+        return engine
+
+    @staticmethod
+    def _count_pairs(np, codes, sizes):
+        codes = np.array(codes, dtype=np.int64)
+        sizes = np.array(sizes, dtype=np.int64)
+        partners = np.repeat(sizes, sizes)
+        basket_start = np.repeat(np.cumsum(sizes) - sizes, sizes)
+        left = np.repeat(np.arange(len(codes)), partners)
+        first = np.repeat(np.cumsum(partners) - partners, partners)
+        right = np.repeat(basket_start, partners) + np.arange(len(left)) - first
+        keep = left != right
+        return np.unique((codes[left[keep]] << 32) | codes[right[keep]], return_counts=True)
+
+    def attach(self, order_log):
+        order_log.listeners.append(self.record)
+
+    def record(self, username, purchase):
+        with self._lock:
+            basket = {self.product_code(item[0]) for item in purchase['items']}
+            for code in basket:
+                row = self._pairs[code]
+                for other in basket:
+                    if other != code:
+                        row[other] = row.get(other, 0) + 1
+                        self._promote(self._top[code], other, row[other])
+            self.version += 1
+
+    def product_code(self, name):
+        code = self._product_codes.get(name)
+        if code is None:
+            code = self._product_codes[name] = len(self.product_names)
+            self.product_names.append(name)
+            self._pairs.append({})
+            self._top.append([])
+        return code
+
+    def also_bought(self, name, k=5):
+        with self._lock:
+            code = self._product_codes.get(name)
+            if code is None:
+                return []
+            if k <= self.TOP_K:
+                entries = [tuple(entry) for entry in self._top[code][:k]]
+            else:
+                entries = heapq.nsmallest(k, ((count, other) for other, count in self._pairs[code].items()),
+                                          key=lambda entry: (-entry[0], entry[1]))
+            return [(self.product_names[other], count) for count, other in entries]
+
+    def recommend(self, names, k=5):
+        names = set(names)
+        scores = {}
+        for name in names:
+            for other, count in self.also_bought(name, self.TOP_K):
+                if other not in names:
+                    scores[other] = scores.get(other, 0) + count
+        return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+
+    def _promote(self, top, code, count):
+        for entry in top:
+            if entry[1] == code:
+                entry[0] = count
+                break
+        else:
+            if len(top) >= self.TOP_K and (-count, code) > (-top[-1][0], top[-1][1]):
+                return
+            top.append([count, code])
+        top.sort(key=lambda entry: (-entry[0], entry[1]))
+        del top[self.TOP_K:]
+
+
+class ProductListing:
+
+    HEADERS = ["ID", "Name", "Price ($)", "Description", "Stock"]
+
+    def __init__(self, products, page_size=20, cache_size=64, also_bought=None):
+        self.products = products
+        self.page_size = page_size
+        self.cache_size = cache_size
+        self.also_bought = also_bought
+        self._cache = OrderedDict()
+
+    def page_count(self):
+        return max(math.ceil(len(self.products) / self.page_size), 1)
+
+    def render(self, page=1, sort="id", descending=False):
+        page = min(max(page, 1), self.page_count())
+        rows = self.products.page((page - 1) * self.page_size, self.page_size, sort, descending)
+        key = (page, self.page_size, sort, descending)
+        stock = tuple(p.stock for p in rows)
+        engine = self.also_bought() if self.also_bought else None
+        version = (self.products.version, engine.version if engine else None)
+        cached = self._cache.get(key)
+        if cached and cached[0] == version and cached[1] == stock:
+            self._cache.move_to_end(key)
+            return cached[2]
+        product_data = [[p.product_id, p.name, p.price, p.description, p.stock] for p in rows]
+        headers = self.HEADERS
+        if engine:
+            headers = headers + ["Also Bought"]
+            for row in product_data:
+                row.append(", ".join(name for name, _ in engine.also_bought(row[1], 2)))
+        text = render_table(product_data, headers)
+        text += f"\nPage {page} of {self.page_count()} (sorted by {sort})"
+        self._cache[key] = (version, stock, text)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+    def stream(self, sort="id", descending=False):
+        for page in range(1, self.page_count() + 1):
+            yield self.render(page, sort, descending)
+
+
+class Cart:
+
+    def __init__(self, inventory=None):
+        self.inventory = inventory
+        self.index = None
+        self.lines = {}
+        self.item_count = 0
+        self.dirty = False
+        self.on_change = None
+        self._subtotal = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def items(self):
+        return [(line[0], line[1]) for line in self.lines.values()]
+
+    @items.setter
+    def items(self, items):
+        self.clear_cart()
+        for product, quantity in items:
+            self._merge(product, quantity)
+
+    @property
+    def total(self):
+        return round(self._subtotal, 2)
+
+    def add_to_cart(self, product, quantity):
+        if self._take(product, quantity):
             print(f"{product.name} added to cart.")
         else:
             print(f"Sorry, only {product.stock} items in stock.")
 
     def remove_from_cart(self, product_id):
-        for item in self.items:
-            if item[0].product_id == product_id:
-                item[0].stock += item[1]
-                self.items.remove(item)
-                print(f"{item[0].name} removed from cart.")
-                return
-        print("Product not found in cart.")
+        line = self._drop(product_id)
+        if line:
+            self._give_back(line)
+            print(f"{line[0].name} removed from cart.")
+        else:
+            print("Product not found in cart.")
+
+    def add_many(self, entries):
+        return [(product, quantity) for product, quantity in entries if not self._take(product, quantity)]
+
+    def remove_many(self, product_ids):
+        removed = 0
+        for product_id in product_ids:
+            line = self._drop(product_id)
+            if line:
+                self._give_back(line)
+                removed += 1
+        return removed
+
+    def move_to(self, other):
+        other.lines = self.lines
+        other.item_count = self.item_count
+        other._subtotal = self._subtotal
+        if other.index is not None:
+            for product_id in other.lines:
+                other.index.add(product_id, other)
+        other._changed()
+        self.clear_cart()
+
+    def track(self, index):
+        self.index = index
+        for product_id in self.lines:
+            index.add(product_id, self)
+
+    def reprice(self, product_id):
+        line = self.lines.get(product_id)
+        if line:
+            amount = line[0].price * line[1]
+            self._subtotal += amount - line[2]
+            line[2] = amount
+
+    def stale_quotes(self):
+        return [(line[0], line[4]) for line in list(self.lines.values()) if line[4] != line[0].price]
+
+    def quote(self):
+        for line in list(self.lines.values()):
+            line[4] = line[0].price
+
+    def commit(self):
+        if not self.inventory:
+            return True
+        holds = []
+        new_holds = []
+        for line in self.lines.values():
+            live = [hold for hold in line[3] if self.inventory.renew(hold)]
+            shortfall = line[1] - sum(hold.quantity for hold in live)
+            if shortfall > 0:
+                hold = self.inventory.reserve(line[0], shortfall)
+                if hold is None:
+                    self.inventory.release_many(new_holds)
+                    return False
+                new_holds.append(hold)
+                live.append(hold)
+            line[3] = live
+            holds.extend(live)
+        while True:
+            failed = self.inventory.commit_all(holds)
+            if not failed:
+                return True
+            replaced = {}
+            for hold in failed:
+                retry = self.inventory.reserve(hold.product, hold.quantity)
+                if retry is None:
+                    self.inventory.release_many(replaced.values())
+                    return False
+                replaced[hold.reservation_id] = retry
+            holds = [replaced.get(hold.reservation_id, hold) for hold in holds]
+            for line in self.lines.values():
+                line[3] = [replaced.get(hold.reservation_id, hold) for hold in line[3]]
+
+    def _take(self, product, quantity):
+        if quantity <= 0:
+            raise ValueError("Quantity must be a positive number.")
+        hold = None
+        if self.inventory:
+            hold = self.inventory.reserve(product, quantity)
+            if hold is None:
+                return False
+        elif product.stock >= quantity:
+            product.stock -= quantity
+        else:
+            return False
+        self._merge(product, quantity, hold)
+        return True
+
+    def _give_back(self, line):
+        if self.inventory:
+            self.inventory.release_many(line[3])
+        else:
+            line[0].stock += line[1]
+
+    def _merge(self, product, quantity, hold=None):
+        line = self.lines.get(product.product_id)
+        if line:
+            line[1] += quantity
+            line[2] += product.price * quantity
+            line[4] = product.price
+        else:
+            line = self.lines[product.product_id] = [product, quantity, product.price * quantity, [], product.price]
+            if self.index is not None:
+                self.index.add(product.product_id, self)
+        if hold:
+            line[3].append(hold)
+        self.item_count += quantity
+        self._subtotal += product.price * quantity
+        self._changed()
+
+    def _drop(self, product_id):
+        line = self.lines.pop(product_id, None)
+        if line:
+            if self.index is not None:
+                self.index.discard(product_id, self)
+            self.item_count -= line[1]
+            self._subtotal = self._subtotal - line[2] if self.lines else 0
+            self._changed()
+        return line
+
+    def _changed(self):
+        self.dirty = True
+        if self.on_change:
+            self.on_change()
 
     def view_cart(self):
-        total_price = 0
         print(
             "---------------------------------------------------------------------------------------------------------------------")
         print("                                           ***** Your Cart *****")
         print(
             "---------------------------------------------------------------------------------------------------------------------")
-        for product, quantity in self.items:
+        for product, quantity, *_ in self.lines.values():
             print(f"{product.name} - ${product.price} x {quantity}")
-            total_price += product.price * quantity
-        print(f"Total Price: ${total_price}")
+        print(f"Total Price: ${self.total}")
+        self.quote()
         print(
             "---------------------------------------------------------------------------------------------------------------------")
 
     def clear_cart(self):
-        self.items = []
+        if self.index is not None:
+            for product_id in self.lines:
+                self.index.discard(product_id, self)
+        self.lines = {}
+        self.item_count = 0
+        self._subtotal = 0
+        self._changed()
 
     def to_dict(self):
         return {
-            "items": [(item[0].to_dict(), item[1]) for item in self.items]
+            "items": [(line[0].to_dict(), line[1]) for line in list(self.lines.values())]
         }
 
     @staticmethod
+    @METRICS.timed("cart_from_dict")
     def from_dict(data, products):
         cart = Cart()
         for item_data in data['items']:
-            product = next((p for p in products if p.product_id == item_data[0]['product_id']), None)
+            product = products.get(item_data[0]['product_id'])
             if product:
-                cart.items.append((product, item_data[1]))
+                cart._merge(product, item_data[1])
+        cart.dirty = False
         return cart
 
 
+class CartIndex:
+
+    def __init__(self, products):
+        self.products = products
+        self._carts = {}
+        self._lock = threading.Lock()
+        products.listeners.append(self.product_changed)
+
+    def __len__(self):
+        return len(self._carts)
+
+    def add(self, product_id, cart):
+        with self._lock:
+            carts = self._carts.get(product_id)
+            if carts is None:
+                carts = self._carts[product_id] = weakref.WeakSet()
+            carts.add(cart)
+
+    def discard(self, product_id, cart):
+        with self._lock:
+            carts = self._carts.get(product_id)
+            if carts is not None:
+                carts.discard(cart)
+                if not carts:
+                    del self._carts[product_id]
+
+    def carts(self, product_id):
+        with self._lock:
+            return list(self._carts.get(product_id, ()))
+
+    def product_changed(self, kind, product, changes):
+        if kind != "update" or "price" not in changes:
+            return
+        carts = self.carts(product.product_id)
+        for cart in carts:
+            cart.reprice(product.product_id)
+        METRICS.observe("shop_repriced_carts", len(carts), buckets=Metrics.SIZE_BUCKETS)
+
+
+class OrderArchive:
+
+    def __init__(self, index_file="orders.archive.idx", segment_file="orders-{:05d}.arc"):
+        self.index_file = index_file
+        self.segment_file = segment_file
+        self.segments = 0
+        self._blocks = None
+        self._lock = threading.Lock()
+
+    def segment(self, number):
+        return self.segment_file.format(number)
+
+    def load(self):
+        with self._lock:
+            if self._blocks is not None:
+                return self._blocks
+            blocks = {}
+            uncommitted = []
+            if os.path.exists(self.index_file):
+                valid_bytes = position = 0
+                with open(self.index_file, "rb+") as file:
+                    for line in file:
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError("incomplete archive entry")
+                            entry = json.loads(line)
+                        except ValueError:
+                            break
+                        position += len(line)
+                        if len(entry) == 2:
+                            for username, *block in uncommitted:
+                                blocks.setdefault(username, []).append(tuple(block))
+                            uncommitted = []
+                            self.segments = entry[1]
+                            valid_bytes = position
+                        else:
+                            uncommitted.append(entry)
+                    file.truncate(valid_bytes)
+                    METRICS.inc("shop_bytes_read_total", position, operation="order_archive_index")
+            self._blocks = blocks
+            return blocks
+
+    def count(self, username):
+        return sum(block[3] for block in self.load().get(username, ()))
+
+    def orders_for(self, username, offset=0, limit=None):
+        stop = None if limit is None else offset + limit
+        base = 0
+        for segment, position, length, count in self.load().get(username, ()):
+            if stop is not None and base >= stop:
+                break
+            start = max(offset - base, 0)
+            end = count if stop is None else min(count, stop - base)
+            base += count
+            if start < end:
+                for line in self._read_block(segment, position, length)[start:end]:
+                    yield dict(json.loads(line), username=username)
+
+    def records(self):
+        blocks = sorted((block, username) for username, entries in self.load().items() for block in entries)
+        for (segment, position, length, _), username in blocks:
+            for line in self._read_block(segment, position, length):
+                yield username, json.loads(line)
+
+    def write_segment(self, groups):
+        self.load()
+        number = self.segments + 1
+        temp_file = self.segment(number) + ".tmp"
+        blocks = []
+        with open(temp_file, "wb") as file:
+            for username, lines in groups.items():
+                data = zlib.compress("".join(lines).encode())
+                blocks.append([username, number, file.tell(), len(data), len(lines)])
+                file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            METRICS.inc("shop_bytes_written_total", file.tell(), operation="order_archive")
+        os.replace(temp_file, self.segment(number))
+        return number, blocks
+
+    def commit(self, number, blocks):
+        with open(self.index_file, "a") as file:
+            for block in blocks:
+                file.write(json.dumps(block) + "\n")
+            file.write(json.dumps(["#roll", number]) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        with self._lock:
+            for username, *block in blocks:
+                self._blocks.setdefault(username, []).append(tuple(block))
+            self.segments = number
+
+    def clear(self):
+        number = 1
+        while os.path.exists(self.segment(number)):
+            os.remove(self.segment(number))
+            number += 1
+        if os.path.exists(self.index_file):
+            os.remove(self.index_file)
+        self.segments = 0
+        self._blocks = None
+
+    def _read_block(self, segment, position, length):
+        with open(self.segment(segment), "rb") as file:
+            file.seek(position)
+            data = file.read(length)
+        METRICS.inc("shop_bytes_read_total", len(data), operation="order_archive")
+        return zlib.decompress(data).decode().splitlines()
+
+
+class OrderLog:
+
+    def __init__(self, log_file="orders.log", index_file="orders.idx", snapshot=None, archive=None):
+        self.log_file = log_file
+        self.index_file = index_file
+        self.snapshot = snapshot
+        self.archive = archive
+        self.listeners = []
+        self.indexed_end = 0
+        self._index = {}
+        self._snapshot_index = {}
+        self._lock = threading.Lock()
+        self._log = None
+        self._idx = None
+        self._log_size = 0
+
+    def open(self):
+        if self.archive is not None:
+            self._recover()
+        indexed_end = self._load_index()
+        self._log = open(self.log_file, "ab")
+        self._idx = open(self.index_file, "a")
+        self._reindex_tail(indexed_end)
+
+    def close(self):
+        with self._lock:
+            for file in (self._log, self._idx):
+                if file:
+                    file.close()
+            self._log = self._idx = None
+
+    def sync(self):
+        with self._lock:
+            for file in (self._log, self._idx):
+                if file:
+                    file.flush()
+                    os.fsync(file.fileno())
+
+    def append(self, username, purchase):
+        line = (json.dumps(dict(purchase, username=username)) + "\n").encode()
+        with self._lock:
+            offset = self._log_size
+            self._log.write(line)
+            self._log.flush()
+            self._log_size += len(line)
+            METRICS.inc("shop_bytes_written_total", len(line), operation="order_log")
+            self._add_to_index(username, purchase['date'], offset)
+        for listener in self.listeners:
+            listener(username, purchase)
+
+    def count(self, username):
+        return len(self._entries(username))
+
+    def index(self):
+        return {username: self._entries(username) for username in set(self._snapshot_index) | set(self._index)}
+
+    def records(self):
+        if self.archive is not None:
+            yield from self.archive.records()
+        with open(self.log_file, "rb") as file:
+            for line in file:
+                record = json.loads(line)
+                yield record.pop('username'), record
+
+    def orders_for(self, username, start=None, end=None, offset=0, limit=None):
+        with self._lock:
+            entries = self._entries(username)
+            low = bisect.bisect_left(entries, (start,)) if start else 0
+            high = bisect.bisect_right(entries, (end, float("inf"))) if end else len(entries)
+            low += offset
+            if limit is not None:
+                high = min(high, low + limit)
+            if low >= high:
+                return
+            entries = entries[low:high]
+            file = open(self.log_file, "rb")
+        with file:
+            for _, position in entries:
+                file.seek(position)
+                line = file.readline()
+                METRICS.inc("shop_bytes_read_total", len(line), operation="order_history")
+                yield json.loads(line)
+
+    @METRICS.timed("archive_orders")
+    def archive_before(self, before):
+        if self.archive is None:
+            return 0
+        with self._lock:
+            groups = OrderedDict()
+            with open(self.log_file, "rb") as file:
+                for line in file:
+                    record = json.loads(line)
+                    if record['date'] < before:
+                        groups.setdefault(record.pop('username'), []).append(json.dumps(record) + "\n")
+            if not groups:
+                return 0
+            number, blocks = self.archive.write_segment(groups)
+            index = {}
+            indexed_end = 0
+            with open(self.log_file, "rb") as source:
+                with open(self.log_file + ".next", "wb") as log, open(self.index_file + ".next", "w") as idx:
+                    for line in source:
+                        record = json.loads(line)
+                        if record['date'] < before:
+                            continue
+                        offset = log.tell()
+                        idx.write(json.dumps([record['username'], record['date'], offset]) + "\n")
+                        index.setdefault(record['username'], []).append((record['date'], offset))
+                        log.write(line)
+                        indexed_end = offset + 1
+                    for file in (log, idx):
+                        file.flush()
+                        os.fsync(file.fileno())
+            self.archive.commit(number, blocks)
+            self._log.close()
+            self._idx.close()
+            for name in (self.index_file, self.log_file):
+                os.replace(name + ".next", name)
+            self._log = open(self.log_file, "ab")
+            self._idx = open(self.index_file, "a")
+            self._log_size = self._log.tell()
+            self._index = index
+            self._snapshot_index = {}
+            self.indexed_end = indexed_end
+        archived = sum(len(lines) for lines in groups.values())
+        METRICS.inc("shop_archived_orders_total", archived)
+        return archived
+
+    def _recover(self):
+        unfinished = [name for name in (self.index_file, self.log_file) if os.path.exists(name + ".next")]
+        if not unfinished:
+            return
+        self.archive.load()
+        segment = self.archive.segment(self.archive.segments + 1)
+        if os.path.exists(segment):
+            for name in unfinished:
+                os.remove(name + ".next")
+            os.remove(segment)
+        else:
+            for name in unfinished:
+                os.replace(name + ".next", name)
+
+    def _entries(self, username):
+        entries = self._index.get(username)
+        if entries is None:
+            entries = self._snapshot_index.get(username, [])
+        return entries
+
+    def _add_to_index(self, username, date, offset, write=True):
+        if write:
+            self._idx.write(json.dumps([username, date, offset]) + "\n")
+            self._idx.flush()
+        entries = self._index.get(username)
+        if entries is None:
+            entries = self._index[username] = list(self._snapshot_index.get(username, ()))
+        entries.append((date, offset))
+        self.indexed_end = max(self.indexed_end, offset + 1)
+
+    def _load_index(self):
+        self._log_size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        indexed_end = 0
+        if not os.path.exists(self.index_file):
+            return indexed_end
+        valid_bytes = 0
+        section = self.snapshot.orders(self.index_file, self._log_size) if self.snapshot else None
+        if section:
+            self._snapshot_index, valid_bytes, indexed_end = section
+            self.indexed_end = indexed_end
+        with open(self.index_file, "rb+") as file:
+            file.seek(valid_bytes)
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete index entry")
+                    username, date, offset = json.loads(line)
+                except ValueError:
+                    break
+                if offset >= self._log_size:
+                    break
+                valid_bytes += len(line)
+                self._add_to_index(username, date, offset, write=False)
+                indexed_end = max(indexed_end, offset + 1)
+            file.truncate(valid_bytes)
+        return indexed_end
+
+    def _reindex_tail(self, indexed_end):
+        if indexed_end:
+            with open(self.log_file, "rb") as file:
+                file.seek(indexed_end - 1)
+                indexed_end += len(file.readline()) - 1
+        valid_bytes = indexed_end
+        with open(self.log_file, "rb") as file:
+            file.seek(indexed_end)
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete order record")
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._add_to_index(record['username'], record['date'], valid_bytes)
+                valid_bytes += len(line)
+        if valid_bytes < self._log_size:
+            self._log.truncate(valid_bytes)
+            self._log_size = valid_bytes
+
+
 class OrderHistory:
 
     def __init__(self):
         self.history = []
+        self.pending = []
+        self.dirty = False
+        self.on_change = None
+        self.username = None
+        self.order_log = None
+        self._lock = threading.Lock()
+
+    def attach(self, order_log, username):
+        self.order_log = order_log
+        self.username = username
 
     def add_purchase(self, purchase):
-        self.history.append(purchase)
+        if not self.order_log:
+            self.history.append(purchase)
+            return
+        with self._lock:
+            self.pending.append(purchase)
+            self.dirty = True
+        if self.on_change:
+            self.on_change()
+        else:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            while self.pending:
+                self.order_log.append(self.username, self.pending[0])
+                self.pending.pop(0)
+            self.dirty = False
+
+    def tiers(self):
+        with self._lock:
+            pending = list(self.pending)
+            logged = self.order_log.count(self.username) if self.order_log else 0
+        archive = self.order_log.archive if self.order_log else None
+        return (
+            (lambda: len(self.history), lambda start, end: self.history[start:end]),
+            (lambda: archive.count(self.username) if archive is not None else 0,
+             lambda start, end: archive.orders_for(self.username, start, end - start)),
+            (lambda: logged, lambda start, end: self.order_log.orders_for(self.username, offset=start, limit=end - start)),
+            (lambda: len(pending), lambda start, end: pending[start:end])
+        )
 
-    def view_history(self):
+    def purchases(self, offset=0, limit=None):
+        stop = None if limit is None else offset + limit
+        base = 0
+        for size, read in self.tiers():
+            size = size()
+            start = max(offset - base, 0)
+            end = size if stop is None else min(size, stop - base)
+            if start < end:
+                yield from read(start, end)
+            base += size
+
+    def recent(self, offset=0, limit=None):
+        for size, read in reversed(self.tiers()):
+            if limit is not None and limit <= 0:
+                break
+            size = size()
+            if offset >= size:
+                offset -= size
+                continue
+            end = size - offset
+            start = 0 if limit is None else max(end - limit, 0)
+            yield from reversed(list(read(start, end)))
+            offset = 0
+            if limit is not None:
+                limit -= end - start
+
+    def view_history(self, page_size=10):
         print(
             "---------------------------------------------------------------------------------------------------------------------")
         print("                                          ***** Your Purchase History *****")
         print(
             "---------------------------------------------------------------------------------------------------------------------")
-        for purchase in self.history:
-            print(f"Date: {purchase['date']}")
-            for item in purchase['items']:
-                print(f"{item[0]} - ${item[2]} x {item[1]}")
-            print(f"Total Price: ${purchase['total_price']}")
-            print(f"Feedback: {purchase['feedback']}")
+        offset = 0
+        while True:
+            page = list(self.recent(offset, page_size + 1))
+            for purchase in page[:page_size]:
+                print(f"Date: {purchase['date']}")
+                for item in purchase['items']:
+                    print(f"{item[0]} - ${item[2]} x {item[1]}")
+                print(f"Total Price: ${purchase['total_price']}")
+                print(f"Feedback: {purchase['feedback']}")
+            offset += page_size
+            if len(page) <= page_size or input("\nPress Enter to see older orders, or q to go back: ").strip().lower() == "q":
+                break
         print(
             "---------------------------------------------------------------------------------------------------------------------")
 
     def to_dict(self):
         return {
-            "history": self.history
+            "history": list(self.history)
         }
 
     @staticmethod
@@ -149,75 +1849,97 @@ class User(Person):
         self.cart = Cart()
         self.saved_cart = Cart()
         self.order_history = OrderHistory()
+        self.dirty = False
+
+    def is_dirty(self):
+        return self.dirty or self.cart.dirty or self.saved_cart.dirty or self.order_history.dirty
+
+    def take_changes(self):
+        registered = self.dirty
+        carts = self.cart.dirty or self.saved_cart.dirty
+        self.dirty = self.cart.dirty = self.saved_cart.dirty = False
+        return registered, carts
+
+    def restore_changes(self, registered, carts):
+        self.dirty = self.dirty or registered
+        self.cart.dirty = self.cart.dirty or carts
 
     def add_to_cart(self, product, quantity):
         try:
             self.cart.add_to_cart(product, quantity)
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="add_to_cart")
             print(f"Error adding product to cart: {e}")
 
     def view_cart(self):
         try:
             self.cart.view_cart()
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="view_cart")
             print(f"Error viewing cart: {e}")
 
     def remove_from_cart(self, product_id):
         try:
             self.cart.remove_from_cart(product_id)
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="remove_from_cart")
             print(f"Error removing product from cart: {e}")
 
     def save_cart(self):
         try:
-            self.saved_cart.items = self.cart.items[:]
-            self.cart.clear_cart()
+            self.cart.move_to(self.saved_cart)
             print("\nCart saved for later access.")
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="save_cart")
             print(f"Error saving cart: {e}")
 
     def load_saved_cart(self):
         try:
-            if not self.saved_cart.items:
+            if not self.saved_cart.lines:
                 print("\nNo saved cart found.")
             else:
-                self.cart.items = self.saved_cart.items[:]
-                self.saved_cart.clear_cart()
+                self.saved_cart.move_to(self.cart)
                 print("\nSaved cart loaded.")
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="load_saved_cart")
             print(f"Error loading saved cart: {e}")
 
+    @METRICS.timed("checkout")
     def checkout(self):
         try:
-            if not self.cart.items:
+            if not self.cart.lines:
                 print("\n*** YOUR CART IS EMPTY ***")
                 return
 
-            total_price = 0
-            items = []
-            for product, quantity in self.cart.items:
-                items.append((product.name, quantity, product.price * quantity))
-                total_price += product.price * quantity
+            changes = self.cart.stale_quotes()
+            if changes:
+                print("\nSome prices have changed since you last viewed your cart:")
+                for product, quoted in changes:
+                    print(f"{product.name}: ${quoted} -> ${product.price}")
+                print(f"Total Price: ${self.cart.total}")
+                if input("Continue with checkout? (yes/no): ").lower() != "yes":
+                    print("\nCheckout cancelled.")
+                    return
+                self.cart.quote()
 
             print("\nPlease enter your payment details:")
             while True:
                 card_number = input("Credit Card Number: ")
-                if card_number.isdigit() and len(card_number) == 13:
+                if User.valid_card_number(card_number):
                     break
                 else:
                     print("Invalid card number. It should be a 13-digit integer.")
 
             while True:
                 expiry_date = input("Expiry Date (MMYY): ")
-                if expiry_date.isdigit() and len(expiry_date) == 4:
+                if User.valid_expiry_date(expiry_date):
                     break
                 else:
                     print("Invalid expiry date. It should be a 4-digit integer.")
 
             while True:
                 cvv = input("CVV: ")
-                if cvv.isdigit() and len(cvv) == 3:
-                    cvv = int(cvv)
+                if User.valid_cvv(cvv):
                     break
                 else:
                     print("Invalid CVV. It should be a 3-digit integer.")
@@ -227,30 +1949,52 @@ class User(Person):
 
             if confirm.lower() == "yes":
                 feedback = input("\nPlease provide your feedback on our service: ")
-                print("\nThank you for your feedback!")
-
-                purchase = {
-                    "date": datetime.datetime.now().isoformat(),
-                    "items": items,
-                    "total_price": total_price,
-                    "feedback": feedback
-                }
-                self.order_history.add_purchase(purchase)
-                self.cart.clear_cart()
-                self.save_purchase_history()
+                if self.place_order(feedback):
+                    print("\nThank you for your feedback!")
+                else:
+                    print("\nSorry, some items in your cart are no longer in stock. Checkout cancelled.")
             else:
                 print("\nCheckout cancelled.")
         except Exception as e:
+            METRICS.inc("shop_errors_total", operation="checkout")
             print(f"Error during checkout: {e}")
 
-    def save_purchase_history(self, filename="purchases.txt"):
-        try:
-            with open(filename, 'a') as file:
-                for purchase in self.order_history.history:
-                    file.write(
-                        f"{purchase['date']},{purchase['items']},{purchase['total_price']},{purchase['feedback']}\n")
-        except Exception as e:
-            print(f"Error saving purchase history: {e}")
+    @METRICS.timed("place_order")
+    def place_order(self, feedback, date=None):
+        if not self.cart.lines or not self.cart.commit():
+            return None
+        METRICS.observe("shop_cart_lines", len(self.cart), buckets=Metrics.SIZE_BUCKETS)
+        purchase = {
+            "date": date or datetime.datetime.now().isoformat(),
+            "items": [(product.name, quantity, amount) for product, quantity, amount, *_ in self.cart.lines.values()],
+            "total_price": self.cart.total,
+            "feedback": feedback
+        }
+        self.order_history.add_purchase(purchase)
+        self.cart.clear_cart()
+        return purchase
+
+    @staticmethod
+    def valid_card_number(card_number):
+        return card_number.isdigit() and len(card_number) == 13
+
+    @staticmethod
+    def valid_expiry_date(expiry_date):
+        return expiry_date.isdigit() and len(expiry_date) == 4
+
+    @staticmethod
+    def valid_cvv(cvv):
+        return cvv.isdigit() and len(cvv) == 3
+
+    @staticmethod
+    def payment_error(card_number, expiry_date, cvv):
+        if not User.valid_card_number(card_number):
+            return "Invalid card number. It should be a 13-digit integer."
+        if not User.valid_expiry_date(expiry_date):
+            return "Invalid expiry date. It should be a 4-digit integer."
+        if not User.valid_cvv(cvv):
+            return "Invalid CVV. It should be a 3-digit integer."
+        return None
 
     def to_dict(self):
         return {
@@ -276,7 +2020,7 @@ class User(Person):
     def display_products(products):
         headers = ["ID", "Name", "Price ($)", "Description", "Stock"]
         product_data = [[p.product_id, p.name, p.price, p.description, p.stock] for p in products]
-        print(tabulate(product_data, headers=headers, tablefmt="grid"))
+        print(render_table(product_data, headers))
 
 
 class Admin(Person):
@@ -287,7 +2031,7 @@ class Admin(Person):
     def view_products(self, products):
         headers = ["ID", "Name", "Price ($)", "Description", "Stock"]
         product_data = [[p.product_id, p.name, p.price, p.description, p.stock] for p in products]
-        print(tabulate(product_data, headers=headers, tablefmt="grid"))
+        print(render_table(product_data, headers))
 
     def add_product(self, products):
         name = input("Enter product name: ")
@@ -308,12 +2052,34 @@ class Admin(Person):
             except ValueError:
                 print("Invalid input. Please enter a valid integer for the stock quantity.")
 
-        product_id = max([p.product_id for p in products], default=0) + 1
-        product = Product(product_id, name, price, description, stock)
-        products.append(product)
+        product = Product(products.next_id(), name, price, description, stock)
+        products.add(product)
         print("\nProduct added successfully.")
 
 
+    def import_products(self, products):
+        feed = CatalogFeed(input("Enter the CSV or JSONL file to import: "))
+        try:
+            added, updated = products.upsert_many(feed)
+        except OSError as e:
+            print(f"Error importing products: {e}")
+            return False
+        print(f"\nImported {added + updated} products ({added} added, {updated} updated).")
+        if feed.rejected:
+            print(f"Skipped {feed.rejected} invalid rows:")
+            for error in feed.errors:
+                print(f"    {error}")
+        return True
+
+    def export_products(self, products):
+        feed = CatalogFeed(input("Enter the CSV or JSONL file to export to: "))
+        try:
+            count = feed.write(products)
+        except OSError as e:
+            print(f"Error exporting products: {e}")
+            return
+        print(f"\nExported {count} products to {feed.path}.")
+
     def remove_product(self, products):
         while True:
             try:
@@ -322,9 +2088,10 @@ class Admin(Person):
             except ValueError:
                 print("Invalid input. Please enter a valid integer for the product ID.")
 
-        products = [p for p in products if p.product_id != product_id]
-        print("\nProduct removed successfully.")
-        return products
+        if products.remove(product_id):
+            print("\nProduct removed successfully.")
+        else:
+            print("\nProduct not found.")
 
 
 
@@ -336,7 +2103,7 @@ class Admin(Person):
             except ValueError:
                 print("Invalid input. Please enter a valid integer for the product ID.")
 
-        product = next((p for p in products if p.product_id == product_id), None)
+        product = products.get(product_id)
 
         if product:
             name = input(f"Enter new name (current: {product.name}): ") or product.name
@@ -353,16 +2120,13 @@ class Admin(Person):
 
             while True:
                 try:
-                    stock_input = input(f"Enter new stock quantity (current: {product.stock}): ") or product.stock
-                    stock = int(stock_input)
+                    stock_input = input(f"Enter new stock quantity (current: {product.stock}): ")
+                    stock = int(stock_input) if stock_input else None
                     break
                 except ValueError:
                     print("Invalid input. Please enter a valid integer for the stock quantity.")
 
-            product.name = name
-            product.price = price
-            product.description = description
-            product.stock = stock
+            products.update(product, name=name, price=price, description=description, stock=stock)
             print("\nProduct modified successfully.")
         else:
             print("\nProduct not found.")
@@ -378,27 +2142,1303 @@ class Admin(Person):
         return Admin(data['username'], data['password'])
 
 
+class CachedUserDirectory(ABC):
+
+    def __init__(self, order_log=None, inventory=None, cache_size=1024):
+        self.order_log = order_log
+        self.inventory = inventory
+        self.cache_size = cache_size
+        self.writer = None
+        self.cart_index = None
+        self.products = None
+        self._cache = OrderedDict()
+        self._live = weakref.WeakValueDictionary()
+        self._unflushed = {}
+        self._lock = threading.RLock()
+
+    @abstractmethod
+    def _read(self, username):
+        pass
+
+    @abstractmethod
+    def _write(self, user, registered):
+        pass
+
+    def cached_users(self):
+        return len(self._cache)
+
+    def get(self, username):
+        with self._lock:
+            user = self._cache.get(username)
+            if user:
+                self._cache.move_to_end(username)
+                return user
+            user = self._unflushed.get(username) or self._live.get(username)
+            if user is None:
+                data = self._read(username)
+                if data is None:
+                    return None
+                user = User.from_dict(data, self.products)
+                self._attach(user)
+                self._live[username] = user
+            self._cache[username] = user
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return user
+
+    def register(self, user):
+        with self._lock:
+            self._attach(user)
+            self._live[user.username] = user
+            self._cache[user.username] = user
+            user.dirty = True
+            self.mark_dirty(user)
+
+    def mark_dirty(self, user):
+        with self._lock:
+            self._unflushed[user.username] = user
+        if self.writer is not None:
+            self.writer.mark(("user", user.username), functools.partial(self.write_user, user))
+        else:
+            self.write_user(user)
+
+    def write_user(self, user):
+        registered, carts = user.take_changes()
+        try:
+            if registered or carts:
+                self._write(user, registered)
+        except Exception:
+            user.restore_changes(registered, carts)
+            raise
+        user.order_history.flush()
+        with self._lock:
+            if not user.is_dirty():
+                self._unflushed.pop(user.username, None)
+
+    def _attach(self, user):
+        if self.order_log:
+            user.order_history.attach(self.order_log, user.username)
+        user.cart.inventory = user.saved_cart.inventory = self.inventory
+        if self.cart_index is not None:
+            user.cart.track(self.cart_index)
+            user.saved_cart.track(self.cart_index)
+        user.cart.on_change = functools.partial(self.mark_dirty, user)
+        user.saved_cart.on_change = user.order_history.on_change = user.cart.on_change
+
+
+class UserDirectory(CachedUserDirectory):
+
+    def __init__(self, snapshot_file="users.json", index_file="users.idx", journal_file="users.journal",
+                 order_log=None, inventory=None, cache_size=1024, compact_every=500, state_snapshot=None):
+        super().__init__(order_log, inventory, cache_size)
+        self.snapshot_file = snapshot_file
+        self.index_file = index_file
+        self.journal_file = journal_file
+        self.rotated_file = journal_file + ".old"
+        self.compact_every = compact_every
+        self.state_snapshot = state_snapshot
+        self.seq = 0
+        self.snapshot_seq = 0
+        self._snapshot_index = {}
+        self._rotated_index = {}
+        self._rotated_seq = 0
+        self._journal_index = {}
+        self._journal_size = 0
+        self._pending = 0
+        self._file = None
+        self._compactor = None
+
+    def __contains__(self, username):
+        return (username in self._unflushed or username in self._journal_index or username in self._rotated_index
+                or username in self._snapshot_index)
+
+    def __len__(self):
+        return len(self.usernames())
+
+    def usernames(self):
+        return set(self._snapshot_index) | set(self._rotated_index) | set(self._journal_index) | set(self._unflushed)
+
+    def snapshot_offsets(self):
+        return self._snapshot_index
+
+    def records(self):
+        for username in self.usernames():
+            with self._lock:
+                yield self._read(username)
+
+    def load(self, products):
+        self.products = products
+        snapshot_seq = self._load_snapshot_index()
+        self.seq = snapshot_seq
+        self._rotated_index, _ = self._index_journal(self.rotated_file, snapshot_seq)
+        self._rotated_seq = self.seq
+        self._journal_index, self._pending = self._index_journal(self.journal_file, snapshot_seq)
+        self._journal_size = os.path.getsize(self.journal_file) if os.path.exists(self.journal_file) else 0
+        self._file = open(self.journal_file, "ab")
+        if os.path.exists(self.rotated_file):
+            self.compact(wait=True)
+        return self
+
+    def _write(self, user, registered):
+        if registered:
+            self._append(user.username, {"op": "register", "user": user.to_dict()})
+        else:
+            self.record_cart(user)
+
+    def record_cart(self, user):
+        self._append(user.username, {
+            "op": "cart",
+            "username": user.username,
+            "cart": user.cart.to_dict(),
+            "saved_cart": user.saved_cart.to_dict()
+        })
+
+    def compact(self, wait=False):
+        if self._compactor and self._compactor.is_alive():
+            if not wait:
+                return
+            self._compactor.join()
+        with self._lock:
+            if not os.path.exists(self.rotated_file):
+                self._file.close()
+                os.replace(self.journal_file, self.rotated_file)
+                self._file = open(self.journal_file, "ab")
+                self._rotated_index = self._journal_index
+                self._rotated_seq = self.seq
+                self._journal_index = {}
+                self._journal_size = 0
+                self._pending = 0
+        self._compactor = threading.Thread(target=self._compact_rotated)
+        self._compactor.start()
+        if wait:
+            self._compactor.join()
+
+    def close(self):
+        if self._compactor:
+            self._compactor.join()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def sync(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def _append(self, username, record):
+        with self._lock:
+            self.seq += 1
+            record['seq'] = self.seq
+            line = (json.dumps(record) + "\n").encode()
+            self._file.write(line)
+            self._file.flush()
+            METRICS.inc("shop_bytes_written_total", len(line), operation="user_journal")
+            self._journal_index.setdefault(username, []).append(self._journal_size)
+            self._journal_size += len(line)
+            self._pending += 1
+        if self._pending >= self.compact_every:
+            self.compact()
+
+    def _read(self, username):
+        data = None
+        bytes_read = 0
+        offset = self._snapshot_index.get(username)
+        if offset is not None:
+            line = self._read_line(self.snapshot_file, offset)
+            bytes_read += len(line)
+            data = json.loads(line.strip().lstrip(b","))
+        for path, index in ((self.rotated_file, self._rotated_index), (self.journal_file, self._journal_index)):
+            for offset in index.get(username, ()):
+                line = self._read_line(path, offset)
+                bytes_read += len(line)
+                data = self._apply(json.loads(line), data)
+        METRICS.inc("shop_bytes_read_total", bytes_read, operation="load_user")
+        return data
+
+    @staticmethod
+    def _read_line(path, offset):
+        with open(path, "rb") as file:
+            file.seek(offset)
+            return file.readline()
+
+    @staticmethod
+    def _apply(record, data):
+        if record['op'] == "register":
+            return record['user']
+        data = dict(data)
+        data['cart'] = record['cart']
+        data['saved_cart'] = record['saved_cart']
+        return data
+
+    def _compact_rotated(self):
+        try:
+            updates = {}
+            for username, offsets in self._rotated_index.items():
+                updates[username] = [json.loads(self._read_line(self.rotated_file, offset)) for offset in offsets]
+            snapshot_users = {offset: username for username, offset in self._snapshot_index.items()}
+
+            def records():
+                if os.path.exists(self.snapshot_file):
+                    with open(self.snapshot_file, "rb") as file:
+                        position = len(file.readline())
+                        for line in file:
+                            username = snapshot_users.get(position)
+                            position += len(line)
+                            if username is None:
+                                continue
+                            raw = line.strip().lstrip(b",")
+                            if username in updates:
+                                data = json.loads(raw)
+                                for record in updates.pop(username):
+                                    data = self._apply(record, data)
+                                raw = json.dumps(data).encode()
+                            yield username, raw
+                for username, pending in updates.items():
+                    data = None
+                    for record in pending:
+                        data = self._apply(record, data)
+                    yield username, json.dumps(data).encode()
+
+            temp_file, offsets = self._write_snapshot(self._rotated_seq, records())
+            with self._lock:
+                self._install_snapshot(temp_file, self._rotated_seq, offsets)
+                self._rotated_index = {}
+                os.remove(self.rotated_file)
+        except Exception as e:
+            METRICS.inc("shop_errors_total", operation="compact_users")
+            print(f"Error compacting user journal: {e}")
+
+    def _write_snapshot(self, seq, records):
+        offsets = {}
+        temp_file = self.snapshot_file + ".tmp"
+        with open(temp_file, "wb") as file:
+            header = f'{{"seq": {seq}, "users": [\n'.encode()
+            file.write(header)
+            position = len(header)
+            for username, raw in records:
+                line = (b"," if offsets else b"") + raw + b"\n"
+                file.write(line)
+                offsets[username] = position
+                position += len(line)
+            file.write(b"]}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        METRICS.inc("shop_bytes_written_total", position + 3, operation="user_snapshot")
+        return temp_file, offsets
+
+    def _install_snapshot(self, temp_file, seq, offsets):
+        os.replace(temp_file, self.snapshot_file)
+        with open(self.index_file + ".tmp", "w") as file:
+            json.dump({"seq": seq, "offsets": offsets}, file)
+        os.replace(self.index_file + ".tmp", self.index_file)
+        self._snapshot_index = offsets
+        self.snapshot_seq = seq
+
+    def _load_snapshot_index(self):
+        if not os.path.exists(self.snapshot_file):
+            return 0
+        with open(self.snapshot_file, "rb") as file:
+            header = file.readline()
+            if not header.endswith(b'"users": [\n'):
+                return self._convert_legacy_snapshot()
+            seq = self.snapshot_seq = json.loads(header + b"]}")['seq']
+            offsets = self.state_snapshot.users(self.snapshot_file, seq) if self.state_snapshot else None
+            if offsets is not None:
+                self._snapshot_index = offsets
+                return seq
+            if os.path.exists(self.index_file):
+                with open(self.index_file, "r") as index:
+                    data = json.load(index)
+                    METRICS.inc("shop_bytes_read_total", index.tell(), operation="load_users")
+                if data['seq'] == seq:
+                    self._snapshot_index = data['offsets']
+                    return seq
+            offsets = {}
+            position = len(header)
+            for line in file:
+                raw = line.strip().lstrip(b",")
+                if raw.startswith(b"{"):
+                    offsets[json.loads(raw)['username']] = position
+                position += len(line)
+        self._install_snapshot(self.snapshot_file, seq, offsets)
+        return seq
+
+    def _convert_legacy_snapshot(self):
+        with open(self.snapshot_file, "r") as file:
+            data = json.load(file)
+        seq = 0
+        if isinstance(data, dict):
+            seq = data['seq']
+            data = data['users']
+        users = {}
+        for u in data:
+            users.setdefault(u['username'], json.dumps(u).encode())
+        temp_file, offsets = self._write_snapshot(seq, users.items())
+        self._install_snapshot(temp_file, seq, offsets)
+        return seq
+
+    def _index_journal(self, path, snapshot_seq):
+        index = {}
+        if not os.path.exists(path):
+            return index, 0
+        indexed = 0
+        valid_bytes = 0
+        with open(path, "rb+") as file:
+            for line in file:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.seq = max(self.seq, record['seq'])
+                if record['seq'] > snapshot_seq:
+                    username = record['user']['username'] if record['op'] == "register" else record['username']
+                    index.setdefault(username, []).append(valid_bytes)
+                    indexed += 1
+                valid_bytes += len(line)
+            file.truncate(valid_bytes)
+        return index, indexed
+
+
+class WriteBehind:
+
+    def __init__(self, interval=1.0, max_pending=256):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.after_flush = []
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if not self._thread:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def mark(self, key, write):
+        with self._lock:
+            self._pending[key] = write
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    @METRICS.timed("write_behind_flush")
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, OrderedDict()
+            for key, write in pending.items():
+                try:
+                    write()
+                except Exception as e:
+                    METRICS.inc("shop_errors_total", operation="write_behind")
+                    print(f"Error saving {key[0]} changes: {e}")
+                    with self._lock:
+                        self._pending.setdefault(key, write)
+            for sync in self.after_flush:
+                try:
+                    sync()
+                except Exception as e:
+                    METRICS.inc("shop_errors_total", operation="write_behind_sync")
+                    print(f"Error syncing changes to disk: {e}")
+            METRICS.observe("shop_coalesced_writes", len(pending), buckets=Metrics.SIZE_BUCKETS)
+            return len(pending)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._pending:
+                self.flush()
+
+
+class PackedStrings:
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position):
+        return bytes(self.blob[self.offsets[position]:self.offsets[position + 1]]).decode()
+
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+    def find(self, value):
+        position = bisect.bisect_left(self, value)
+        return position if position < len(self) and self[position] == value else None
+
+    @staticmethod
+    def pack(strings):
+        offsets = array.array("q", [0])
+        blob = bytearray()
+        for string in strings:
+            blob += string.encode()
+            offsets.append(len(blob))
+        return offsets, blob
+
+
+class PackedIndex(Mapping):
+
+    def __init__(self, keys, value_at):
+        self._keys = keys
+        self._value_at = value_at
+
+    def __getitem__(self, key):
+        position = self._keys.find(key)
+        if position is None:
+            raise KeyError(key)
+        return self._value_at(position)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class StateSnapshot:
+
+    MAGIC = b"SHOPSNAP1\n"
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest = None
+        self._file = None
+        self._map = None
+        self._views = []
+
+    def open(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError("not a state snapshot")
+            length = int.from_bytes(self._map[len(self.MAGIC):len(self.MAGIC) + 8], "little")
+            self.manifest = json.loads(self._map[len(self.MAGIC) + 8:len(self.MAGIC) + 8 + length])
+            if self.manifest['byteorder'] != sys.byteorder:
+                raise ValueError("snapshot was written on a machine with a different byte order")
+            self._base = self._data_start(length)
+            self._views.append(memoryview(self._map))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading state snapshot: {e}")
+            self.close()
+            return None
+        METRICS.inc("shop_bytes_read_total", self._base, operation="load_snapshot")
+        return self
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        for resource in (self._map, self._file):
+            if resource:
+                resource.close()
+        self._map = self._file = self.manifest = None
+
+    def current(self, section, source):
+        info = self.manifest['sections'].get(section) if self.manifest else None
+        return info is not None and info['source'] == source
+
+    def section(self, name):
+        info = self.manifest['sections'][name]
+        return {"source": info['source'], "meta": info['meta'],
+                "blobs": {blob: self._view(name, blob) for blob in info['blobs']}}
+
+    def catalog(self, source, compact=False):
+        if not self.current("catalog", source):
+            return None
+        columns = {}
+        for name, typecode in (("ids", "q"), ("prices", "d"), ("stock", "q"), ("name_offsets", "q"),
+                               ("name_lengths", "I"), ("description_offsets", "q"), ("description_lengths", "I"),
+                               ("by_price", "q"), ("by_name", "q")):
+            columns[name] = array.array(typecode)
+            columns[name].frombytes(self._view("catalog", name))
+        columns['strings'] = self._view("catalog", "strings")
+        if compact:
+            products = CompactProductStore.from_columns(columns)
+        else:
+            strings = columns['strings']
+            products = {}
+            for row, product_id in enumerate(columns['ids']):
+                name = columns['name_offsets'][row]
+                description = columns['description_offsets'][row]
+                products[product_id] = Product(
+                    product_id,
+                    bytes(strings[name:name + columns['name_lengths'][row]]).decode(),
+                    columns['prices'][row],
+                    bytes(strings[description:description + columns['description_lengths'][row]]).decode(),
+                    columns['stock'][row]
+                )
+        return ProductCatalog.restore(products, columns['ids'], columns['by_price'], columns['by_name'])
+
+    def users(self, path, seq):
+        if not self.current("users", self.source(path)) or self.manifest['sections']['users']['meta']['seq'] != seq:
+            return None
+        offsets = self._view("users", "offsets", "q")
+        return PackedIndex(self._strings("users", "usernames"), offsets.__getitem__)
+
+    def orders(self, path, log_size):
+        info = self.manifest['sections'].get("orders") if self.manifest else None
+        if not info:
+            return None
+        size, inode = info['source']
+        try:
+            stat = os.stat(path)
+            with open(path, "rb") as file:
+                file.seek(max(size - 1, 0))
+                boundary = file.read(1) if size else b"\n"
+        except OSError:
+            return None
+        if stat.st_ino != inode or stat.st_size < size or boundary != b"\n" or info['meta']['indexed_end'] > log_size:
+            return None
+        starts = self._view("orders", "starts", "q")
+        dates = self._strings("orders", "dates")
+        positions = self._view("orders", "positions", "q")
+
+        def entries(position):
+            return [(dates[entry], positions[entry]) for entry in range(starts[position], starts[position + 1])]
+
+        return PackedIndex(self._strings("orders", "usernames"), entries), size, info['meta']['indexed_end']
+
+    def _view(self, section, blob, typecode=None):
+        offset, length = self.manifest['sections'][section]['blobs'][blob]
+        view = self._views[0][self._base + offset:self._base + offset + length]
+        self._views.append(view)
+        if typecode:
+            view = view.cast(typecode)
+            self._views.append(view)
+        return view
+
+    def _strings(self, section, name):
+        return PackedStrings(self._view(section, name + "_offsets", "q"), self._view(section, name))
+
+    def _data_start(self, manifest_length):
+        header = len(self.MAGIC) + 8 + manifest_length
+        return header + (-header % 8)
+
+    @staticmethod
+    def source(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+    @staticmethod
+    def catalog_section(catalog, source, held=None):
+        held = held or {}
+        products = catalog.page(0, len(catalog))
+        name_offsets, names = PackedStrings.pack(p.name for p in products)
+        description_offsets, descriptions = PackedStrings.pack(p.description for p in products)
+        lengths = array.array("I", (name_offsets[i + 1] - name_offsets[i] for i in range(len(products))))
+        description_lengths = array.array("I", (description_offsets[i + 1] - description_offsets[i]
+                                                for i in range(len(products))))
+        description_offsets = array.array("q", (offset + len(names) for offset in description_offsets[:-1]))
+        return {"source": source, "meta": {"count": len(products)}, "blobs": {
+            "ids": array.array("q", (p.product_id for p in products)),
+            "prices": array.array("d", (p.price for p in products)),
+            "stock": array.array("q", (p.stock + held.get(p.product_id, 0) for p in products)),
+            "name_offsets": name_offsets[:-1],
+            "name_lengths": lengths,
+            "description_offsets": description_offsets,
+            "description_lengths": description_lengths,
+            "strings": names + descriptions,
+            "by_price": array.array("q", (p.product_id for p in catalog.page(0, len(catalog), "price"))),
+            "by_name": array.array("q", (p.product_id for p in catalog.page(0, len(catalog), "name")))
+        }}
+
+    @staticmethod
+    def users_section(offsets, seq, source):
+        usernames = sorted(offsets)
+        username_offsets, blob = PackedStrings.pack(usernames)
+        return {"source": source, "meta": {"seq": seq}, "blobs": {
+            "usernames_offsets": username_offsets,
+            "usernames": blob,
+            "offsets": array.array("q", (offsets[username] for username in usernames))
+        }}
+
+    @staticmethod
+    def orders_section(index, indexed_end, source):
+        usernames = sorted(index)
+        starts = array.array("q", [0])
+        positions = array.array("q")
+        dates = []
+        for username in usernames:
+            for date, position in index[username]:
+                dates.append(date)
+                positions.append(position)
+            starts.append(len(positions))
+        username_offsets, username_blob = PackedStrings.pack(usernames)
+        date_offsets, date_blob = PackedStrings.pack(dates)
+        return {"source": source, "meta": {"indexed_end": indexed_end}, "blobs": {
+            "usernames_offsets": username_offsets,
+            "usernames": username_blob,
+            "starts": starts,
+            "dates_offsets": date_offsets,
+            "dates": date_blob,
+            "positions": positions
+        }}
+
+    @classmethod
+    def write(cls, path, sections):
+        manifest = {"byteorder": sys.byteorder, "sections": {}}
+        position = 0
+        for name, section in sections.items():
+            blobs = {}
+            for blob, data in section['blobs'].items():
+                length = memoryview(data).nbytes
+                blobs[blob] = [position, length]
+                position += length + (-length % 8)
+            manifest['sections'][name] = {"source": section['source'], "meta": section['meta'], "blobs": blobs}
+        encoded = json.dumps(manifest).encode()
+        temp_file = path + ".tmp"
+        with open(temp_file, "wb") as file:
+            file.write(cls.MAGIC + len(encoded).to_bytes(8, "little") + encoded)
+            file.write(bytes(-file.tell() % 8))
+            for section in sections.values():
+                for data in section['blobs'].values():
+                    file.write(data)
+                    file.write(bytes(-memoryview(data).nbytes % 8))
+            file.flush()
+            os.fsync(file.fileno())
+            METRICS.inc("shop_bytes_written_total", file.tell(), operation="save_snapshot")
+        return temp_file
+
+
+class Storage(ABC):
+
+    @abstractmethod
+    def load_products(self):
+        pass
+
+    @abstractmethod
+    def save_products(self, products, changed=None, held=None):
+        pass
+
+    @abstractmethod
+    def load_admins(self):
+        pass
+
+    @abstractmethod
+    def save_admins(self, admins):
+        pass
+
+    @abstractmethod
+    def open_order_log(self):
+        pass
+
+    @abstractmethod
+    def open_users(self, order_log=None, inventory=None):
+        pass
+
+    @abstractmethod
+    def user_records(self):
+        pass
+
+    @abstractmethod
+    def order_records(self):
+        pass
+
+    @abstractmethod
+    def import_records(self, products, admins, users, orders):
+        pass
+
+    def load_catalog(self, compact=False):
+        return ProductCatalog(self.load_products(), compact=compact)
+
+    def save_state(self, products, users, order_log, held=None):
+        pass
+
+    def close(self):
+        pass
+
+    def copy_to(self, other):
+        other.import_records(self.load_products(), self.load_admins(), self.user_records(), self.order_records())
+
+
+class JSONStorage(Storage):
+
+    PRODUCTS_JOURNAL_MIN = 1 << 20
+
+    def __init__(self, directory=".", snapshot=True):
+        self.directory = directory
+        self.use_snapshot = snapshot
+        self._snapshot = None
+        self._catalog_state = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def snapshot(self):
+        if self.use_snapshot and self._snapshot is None:
+            self._snapshot = StateSnapshot(self.path("state.snap")).open() or False
+        return self._snapshot or None
+
+    def catalog_source(self):
+        source = StateSnapshot.source(self.path("products.json"))
+        journal = StateSnapshot.source(self.path("products.journal"))
+        return source + journal if source and journal else source
+
+    def load_catalog(self, compact=False):
+        snapshot = self.snapshot()
+        source = self.catalog_source()
+        catalog = snapshot.catalog(source, compact) if snapshot else None
+        if catalog is None:
+            catalog = ProductCatalog(self.load_products(), compact=compact)
+        self._catalog_state = (source, catalog, catalog.version)
+        return catalog
+
+    def save_state(self, products, users, order_log, held=None):
+        if not self.use_snapshot:
+            return
+        snapshot = self.snapshot()
+        sections = {}
+        rewrite = False
+        source = self.catalog_source()
+        journaled = os.path.exists(self.path("products.journal"))
+        if journaled and self._catalog_state == (source, products, products.version):
+            self.save_products(products, None, held)
+            source = self.catalog_source()
+        if source and snapshot and snapshot.current("catalog", source):
+            sections["catalog"] = snapshot.section("catalog")
+        elif source:
+            if self._catalog_state != (source, products, products.version):
+                products = ProductCatalog(self.load_products(), compact=True)
+                held = None
+            sections["catalog"] = StateSnapshot.catalog_section(products, source, held)
+            rewrite = True
+        source = StateSnapshot.source(self.path("users.json"))
+        if source and snapshot and snapshot.users(self.path("users.json"), users.snapshot_seq) is not None:
+            sections["users"] = snapshot.section("users")
+        elif source:
+            sections["users"] = StateSnapshot.users_section(users.snapshot_offsets(), users.snapshot_seq, source)
+            rewrite = True
+        if os.path.exists(self.path("orders.idx")):
+            stat = os.stat(self.path("orders.idx"))
+            source = [stat.st_size, stat.st_ino]
+            if snapshot and snapshot.manifest['sections'].get("orders", {}).get("source") == source:
+                sections["orders"] = snapshot.section("orders")
+            else:
+                sections["orders"] = StateSnapshot.orders_section(order_log.index(), order_log.indexed_end, source)
+                rewrite = True
+        if not rewrite and (not snapshot or set(sections) == set(snapshot.manifest['sections'])):
+            return
+        temp_file = StateSnapshot.write(self.path("state.snap"), sections)
+        if snapshot:
+            snapshot.close()
+            self._snapshot = None
+        os.replace(temp_file, self.path("state.snap"))
+
+    def close(self):
+        if self._snapshot:
+            self._snapshot.close()
+            self._snapshot = None
+
+    def load_products(self):
+        changes = self._journaled_products()
+        for product in self._read_products():
+            if product.product_id not in changes:
+                yield product
+            elif changes[product.product_id]:
+                yield Product.from_dict(changes.pop(product.product_id))
+            else:
+                del changes[product.product_id]
+        for product_id in sorted(changes):
+            if changes[product_id]:
+                yield Product.from_dict(changes[product_id])
+
+    def _read_products(self):
+        if not os.path.exists(self.path("products.json")):
+            return
+        with open(self.path("products.json"), "r") as file:
+            file.readline()
+            line = file.readline().strip().lstrip(",")
+            if line.startswith("{") and line.endswith("}"):
+                while line.startswith("{"):
+                    yield Product.from_dict(json.loads(line))
+                    line = file.readline().strip().lstrip(",")
+            else:
+                file.seek(0)
+                for p in json.load(file):
+                    yield Product.from_dict(p)
+            METRICS.inc("shop_bytes_read_total", file.tell(), operation="load_products")
+
+    def save_products(self, products, changed=None, held=None):
+        held = held or {}
+        if changed is None or not self._journal_products(products, changed, held):
+            temp_file = self.path("products.json.tmp")
+            with open(temp_file, "w") as file:
+                file.write("[\n")
+                for index, p in enumerate(products):
+                    file.write(("," if index else "") + json.dumps(p.to_dict(held.get(p.product_id, 0))) + "\n")
+                file.write("]\n")
+                file.flush()
+                os.fsync(file.fileno())
+                METRICS.inc("shop_bytes_written_total", file.tell(), operation="save_products")
+            os.replace(temp_file, self.path("products.json"))
+            if os.path.exists(self.path("products.journal")):
+                os.remove(self.path("products.journal"))
+        if isinstance(products, ProductCatalog):
+            self._catalog_state = (self.catalog_source(), products, products.version)
+
+    def _journal_products(self, products, changed, held):
+        base = StateSnapshot.source(self.path("products.json"))
+        if not base:
+            return False
+        journal = self.path("products.journal")
+        fresh = self._journal_base() != base
+        if not fresh and os.path.getsize(journal) > max(self.PRODUCTS_JOURNAL_MIN, base[0]):
+            return False
+        with open(journal, "w" if fresh else "a") as file:
+            if fresh:
+                file.write(json.dumps({"base": base}) + "\n")
+            for product_id in changed:
+                product = products.get(product_id)
+                if product is None:
+                    file.write(json.dumps({"remove": product_id}) + "\n")
+                else:
+                    file.write(json.dumps({"product": product.to_dict(held.get(product_id, 0))}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+            METRICS.inc("shop_bytes_written_total", file.tell(), operation="product_journal")
+        return True
+
+    def _journal_base(self):
+        try:
+            with open(self.path("products.journal"), "r") as file:
+                return json.loads(file.readline()).get("base")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _journaled_products(self):
+        changes = {}
+        base = StateSnapshot.source(self.path("products.json"))
+        if not base or self._journal_base() != base:
+            return changes
+        with open(self.path("products.journal"), "r") as file:
+            file.readline()
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "remove" in record:
+                    changes[record['remove']] = None
+                else:
+                    changes[record['product']['product_id']] = record['product']
+            METRICS.inc("shop_bytes_read_total", file.tell(), operation="product_journal")
+        return changes
+
+    def load_admins(self):
+        if not os.path.exists(self.path("admins.json")):
+            return []
+        with open(self.path("admins.json"), "r") as file:
+            admins = [Admin.from_dict(a) for a in json.load(file)]
+            METRICS.inc("shop_bytes_read_total", file.tell(), operation="load_admins")
+            return admins
+
+    def save_admins(self, admins):
+        temp_file = self.path("admins.json.tmp")
+        with open(temp_file, "w") as file:
+            json.dump([a.to_dict() for a in admins], file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+            METRICS.inc("shop_bytes_written_total", file.tell(), operation="save_admins")
+        os.replace(temp_file, self.path("admins.json"))
+
+    def order_archive(self):
+        return OrderArchive(self.path("orders.archive.idx"), self.path("orders-{:05d}.arc"))
+
+    def open_order_log(self):
+        order_log = OrderLog(self.path("orders.log"), self.path("orders.idx"), self.snapshot(), self.order_archive())
+        order_log.open()
+        return order_log
+
+    def open_users(self, order_log=None, inventory=None):
+        return UserDirectory(self.path("users.json"), self.path("users.idx"), self.path("users.journal"),
+                             order_log=order_log, inventory=inventory, state_snapshot=self.snapshot())
+
+    def user_records(self):
+        users = UserDirectory(self.path("users.json"), self.path("users.idx"), self.path("users.journal")).load(None)
+        try:
+            yield from users.records()
+        finally:
+            users.close()
+
+    def order_records(self):
+        order_log = OrderLog(self.path("orders.log"), self.path("orders.idx"), archive=self.order_archive())
+        order_log.open()
+        try:
+            yield from order_log.records()
+        finally:
+            order_log.close()
+
+    def import_records(self, products, admins, users, orders):
+        self.close()
+        self.save_products(products)
+        self.save_admins(admins)
+        for name in ("users.idx", "users.journal", "users.journal.old", "orders.idx", "orders.idx.next",
+                     "orders.log.next", "state.snap"):
+            if os.path.exists(self.path(name)):
+                os.remove(self.path(name))
+        self.order_archive().clear()
+        with open(self.path("users.json"), "w") as file:
+            json.dump(list(users), file)
+        with open(self.path("orders.log"), "w") as file:
+            for username, purchase in orders:
+                file.write(json.dumps(dict(purchase, username=username)) + "\n")
+
+
+class SQLiteStorage(Storage):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS products (
+            product_id INTEGER PRIMARY KEY, name TEXT, price REAL, description TEXT, stock INTEGER);
+        CREATE TABLE IF NOT EXISTS admins (username TEXT PRIMARY KEY, password TEXT);
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY, first_name TEXT, last_name TEXT, address TEXT, password TEXT,
+            history TEXT DEFAULT '[]');
+        CREATE TABLE IF NOT EXISTS cart_items (
+            username TEXT, cart TEXT, product_id INTEGER, quantity INTEGER,
+            PRIMARY KEY (username, cart, product_id));
+        CREATE TABLE IF NOT EXISTS orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, date TEXT, items TEXT,
+            total_price REAL, feedback TEXT);
+        CREATE INDEX IF NOT EXISTS orders_by_user ON orders (username, date);
+    """
+
+    def __init__(self, database="shop.db", pool_size=4, batch_size=64, flush_interval=1.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            connection = sqlite3.connect(database, check_same_thread=False, cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(connection)
+        with self.connection() as connection:
+            connection.executescript(self.SCHEMA)
+        self._writes = []
+        self._write_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    @contextmanager
+    def connection(self):
+        connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def write(self, sql, params=()):
+        with self._write_lock:
+            self._writes.append((sql, params))
+            if len(self._writes) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            writes, self._writes = self._writes, []
+            if not writes:
+                return
+            try:
+                with self.connection() as connection:
+                    with connection:
+                        for sql, group in itertools.groupby(writes, key=lambda write: write[0]):
+                            connection.executemany(sql, [params for _, params in group])
+            except Exception:
+                self._writes[:0] = writes
+                raise
+
+    def query(self, sql, params=()):
+        self.flush()
+        with self.connection() as connection:
+            return connection.execute(sql, params).fetchall()
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        while not self._pool.empty():
+            self._pool.get().close()
+
+    def load_products(self):
+        return [Product(*row) for row in self.query(
+            "SELECT product_id, name, price, description, stock FROM products ORDER BY product_id")]
+
+    def get_product(self, product_id):
+        rows = self.query("SELECT product_id, name, price, description, stock FROM products WHERE product_id = ?",
+                          (product_id,))
+        return Product(*rows[0]) if rows else None
+
+    def save_products(self, products, changed=None, held=None):
+        held = held or {}
+        with self._write_lock:
+            if changed is None:
+                self.write("DELETE FROM products")
+            else:
+                for product_id in changed:
+                    if product_id not in products:
+                        self.write("DELETE FROM products WHERE product_id = ?", (product_id,))
+                products = [products.get(product_id) for product_id in changed if product_id in products]
+            for p in products:
+                self.write("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+                           (p.product_id, p.name, p.price, p.description, p.stock + held.get(p.product_id, 0)))
+            self.flush()
+
+    def load_admins(self):
+        return [Admin(*row) for row in self.query("SELECT username, password FROM admins")]
+
+    def save_admins(self, admins):
+        with self._write_lock:
+            self.write("DELETE FROM admins")
+            for a in admins:
+                self.write("INSERT INTO admins VALUES (?, ?)", (a.username, a.password))
+            self.flush()
+
+    def open_order_log(self):
+        return SQLiteOrderLog(self)
+
+    def open_users(self, order_log=None, inventory=None):
+        return SQLiteUserDirectory(self, order_log=order_log, inventory=inventory)
+
+    def user_exists(self, username):
+        return bool(self.query("SELECT 1 FROM users WHERE username = ?", (username,)))
+
+    def user_record(self, username):
+        rows = self.query("SELECT first_name, last_name, address, username, password, history FROM users "
+                          "WHERE username = ?", (username,))
+        if not rows:
+            return None
+        carts = {"cart": [], "saved_cart": []}
+        for cart, product_id, quantity in self.query(
+                "SELECT cart, product_id, quantity FROM cart_items WHERE username = ?", (username,)):
+            carts[cart].append(({"product_id": product_id}, quantity))
+        first_name, last_name, address, username, password, history = rows[0]
+        return {
+            "first_name": first_name,
+            "last_name": last_name,
+            "address": address,
+            "username": username,
+            "password": password,
+            "cart": {"items": carts["cart"]},
+            "saved_cart": {"items": carts["saved_cart"]},
+            "order_history": {"history": json.loads(history)}
+        }
+
+    def user_records(self):
+        for (username,) in self.query("SELECT username FROM users ORDER BY rowid"):
+            yield self.user_record(username)
+
+    def write_user(self, data):
+        with self._write_lock:
+            self.write("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)",
+                       (data['username'], data['first_name'], data['last_name'], data['address'],
+                        data['password'], json.dumps(data['order_history']['history'])))
+            self.write_cart(data['username'], data['cart'], data['saved_cart'])
+
+    def write_cart(self, username, cart, saved_cart):
+        with self._write_lock:
+            self.write("DELETE FROM cart_items WHERE username = ?", (username,))
+            for name, data in (("cart", cart), ("saved_cart", saved_cart)):
+                for product, quantity in data['items']:
+                    self.write("INSERT OR REPLACE INTO cart_items VALUES (?, ?, ?, ?)",
+                               (username, name, product['product_id'], quantity))
+
+    def write_order(self, username, purchase):
+        self.write("INSERT INTO orders (username, date, items, total_price, feedback) VALUES (?, ?, ?, ?, ?)",
+                   (username, purchase['date'], json.dumps(purchase['items']), purchase['total_price'],
+                    purchase['feedback']))
+
+    def orders_for(self, username, start=None, end=None, offset=0, limit=None):
+        rows = self.query(
+            "SELECT date, items, total_price, feedback FROM orders WHERE username = ? AND date >= ? AND date <= ? "
+            "ORDER BY date, order_id LIMIT ? OFFSET ?",
+            (username, start or "", end or "\uffff", -1 if limit is None else limit, offset))
+        for date, items, total_price, feedback in rows:
+            yield {"date": date, "items": json.loads(items), "total_price": total_price, "feedback": feedback}
+
+    def count_orders(self, username):
+        return self.query("SELECT COUNT(*) FROM orders WHERE username = ?", (username,))[0][0]
+
+    def order_records(self):
+        for username, date, items, total_price, feedback in self.query(
+                "SELECT username, date, items, total_price, feedback FROM orders ORDER BY order_id"):
+            yield username, {"date": date, "items": json.loads(items), "total_price": total_price,
+                             "feedback": feedback}
+
+    def import_records(self, products, admins, users, orders):
+        self.save_products(products)
+        self.save_admins(admins)
+        with self._write_lock:
+            self.write("DELETE FROM users")
+            self.write("DELETE FROM cart_items")
+            self.write("DELETE FROM orders")
+            for data in users:
+                self.write_user(data)
+            for username, purchase in orders:
+                self.write_order(username, purchase)
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                METRICS.inc("shop_errors_total", operation="flush_database")
+                print(f"Error flushing database writes: {e}")
+
+
+class SQLiteOrderLog:
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.listeners = []
+        self.archive = None
+
+    def open(self):
+        pass
+
+    def close(self):
+        self.storage.flush()
+
+    def sync(self):
+        self.storage.flush()
+
+    def append(self, username, purchase):
+        self.storage.write_order(username, purchase)
+        for listener in self.listeners:
+            listener(username, purchase)
+
+    def count(self, username):
+        return self.storage.count_orders(username)
+
+    def orders_for(self, username, start=None, end=None, offset=0, limit=None):
+        return self.storage.orders_for(username, start, end, offset, limit)
+
+    def records(self):
+        return self.storage.order_records()
+
+    def archive_before(self, before):
+        return 0
+
+
+class SQLiteUserDirectory(CachedUserDirectory):
+
+    def __init__(self, storage, order_log=None, inventory=None, cache_size=1024):
+        super().__init__(order_log, inventory, cache_size)
+        self.storage = storage
+
+    def __contains__(self, username):
+        return username in self._cache or username in self._unflushed or self.storage.user_exists(username)
+
+    def __len__(self):
+        return self.storage.query("SELECT COUNT(*) FROM users")[0][0]
+
+    def usernames(self):
+        return {username for (username,) in self.storage.query("SELECT username FROM users")} | set(self._unflushed)
+
+    def load(self, products):
+        self.products = products
+        return self
+
+    def _read(self, username):
+        return self.storage.user_record(username)
+
+    def _write(self, user, registered):
+        if registered:
+            self.storage.write_user(user.to_dict())
+        else:
+            self.record_cart(user)
+
+    def record_cart(self, user):
+        self.storage.write_cart(user.username, user.cart.to_dict(), user.saved_cart.to_dict())
+
+    def records(self):
+        return self.storage.user_records()
+
+    def compact(self, wait=False):
+        self.storage.flush()
+        with self.storage.connection() as connection:
+            connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        self.storage.flush()
+
+    def sync(self):
+        self.storage.flush()
+
 
 class ShoppingCartApp:
 
-    def __init__(self):
-        self.products = [Product(1, "Laptop", 999.99, "A high-performance laptop.", 10),
-                         Product(2, "Smartphone", 499.99, "A latest model smartphone.", 20),
-                         Product(3, "Headphones", 199.99, "Noise-cancelling headphones.", 15),
-                         Product(4, "Smartwatch", 299.99, "A smartwatch with various features.", 25),
-                         Product(5, "Camera", 599.99, "A digital camera with high resolution.", 5),
-                         Product(6, "Tablet", 399.99, "A tablet with a large display.", 8),
-                         Product(7, "Printer", 149.99, "A wireless printer.", 12),
-                         Product(8, "Monitor", 249.99, "A 4K monitor.", 7),
-                         Product(9, "Keyboard", 79.99, "A mechanical keyboard.", 18),
-                         Product(10, "Mouse", 49.99, "A wireless mouse.", 22),
-                         Product(11, "VR Headset", 399.99, "A virtual reality headset", 5),
-                         Product(12, "Drone", 499.99, "A high-performance drone with 4K camera.", 7),
-                         Product(13, "Portable SSD", 149.99, "A 1TB portable SSD.", 18),
-                         Product(14, "Smart Doorbell", 179.99, "A smart doorbell with video camera", 8),
-                         Product(15, "Wireless Earbuds", 149.99, "Noise-cancelling wireless earbuds.", 17)]
-        self.users = self.load_users()
+    DEFAULT_PRODUCTS = [Product(1, "Laptop", 999.99, "A high-performance laptop.", 10),
+                        Product(2, "Smartphone", 499.99, "A latest model smartphone.", 20),
+                        Product(3, "Headphones", 199.99, "Noise-cancelling headphones.", 15),
+                        Product(4, "Smartwatch", 299.99, "A smartwatch with various features.", 25),
+                        Product(5, "Camera", 599.99, "A digital camera with high resolution.", 5),
+                        Product(6, "Tablet", 399.99, "A tablet with a large display.", 8),
+                        Product(7, "Printer", 149.99, "A wireless printer.", 12),
+                        Product(8, "Monitor", 249.99, "A 4K monitor.", 7),
+                        Product(9, "Keyboard", 79.99, "A mechanical keyboard.", 18),
+                        Product(10, "Mouse", 49.99, "A wireless mouse.", 22),
+                        Product(11, "VR Headset", 399.99, "A virtual reality headset", 5),
+                        Product(12, "Drone", 499.99, "A high-performance drone with 4K camera.", 7),
+                        Product(13, "Portable SSD", 149.99, "A 1TB portable SSD.", 18),
+                        Product(14, "Smart Doorbell", 179.99, "A smart doorbell with video camera", 8),
+                        Product(15, "Wireless Earbuds", 149.99, "Noise-cancelling wireless earbuds.", 17)]
+
+    def __init__(self, storage=None, compact_catalog=False, flush_interval=1.0):
+        self.storage = storage or JSONStorage()
+        self.compact_catalog = compact_catalog
+        self.writer = WriteBehind(flush_interval)
+        self.products = self.load_products()
+        self.products.on_change = self._products_changed
+        self.order_log = self.storage.open_order_log()
+        self.inventory = InventoryManager()
+        self.inventory.listeners.append(self._stock_committed)
+        self.inventory.start()
+        self.cart_index = CartIndex(self.products)
+        self.users = self.storage.open_users(order_log=self.order_log, inventory=self.inventory)
+        self.users.cart_index = self.cart_index
+        self.load_users()
+        self.users.writer = self.writer
+        self.writer.after_flush.extend((self.users.sync, self.order_log.sync))
+        self.writer.start()
         self.admins = self.load_admins()
+        self.listing = ProductListing(self.products, also_bought=self.recommendations)
+        self.analytics = None
+        self.also_bought = None
+        self._also_bought_lock = threading.Lock()
+        METRICS.gauge("shop_catalog_products", lambda: len(self.products))
+        METRICS.gauge("shop_cached_users", lambda: self.users.cached_users())
+        METRICS.gauge("shop_write_behind_pending", lambda: len(self.writer))
         self.current_user = None
         self.current_admin = None
         self.ensure_admin()
@@ -408,35 +3448,40 @@ class ShoppingCartApp:
             self.admins.append(Admin("Maria", "maria123"))
             self.save_admins()
 
+    @METRICS.timed("load_products")
     def load_products(self):
-        if not os.path.exists("products.json"):
-            return []
-        with open("products.json", "r") as file:
-            return [Product.from_dict(p) for p in json.load(file)]
+        products = self.storage.load_catalog(self.compact_catalog)
+        if not len(products):
+            products.extend(Product.from_dict(p.to_dict()) for p in self.DEFAULT_PRODUCTS)
+            products.mark_dirty(None)
+        return products
 
+    @METRICS.timed("save_products")
     def save_products(self):
-        with open("products.json", "w") as file:
-            json.dump([p.to_dict() for p in self.products], file, indent=4)
+        self.storage.save_products(self.products, self.products.take_dirty(), self.inventory.held())
 
+    def flush(self):
+        return self.writer.flush()
+
+    def _products_changed(self):
+        self.writer.mark(("products",), self.save_products)
+
+    def _stock_committed(self, holds):
+        self.products.mark_dirty({hold.product.product_id for hold in holds})
+
+    @METRICS.timed("load_users")
     def load_users(self):
-        if not os.path.exists("users.json"):
-            return []
-        with open("users.json", "r") as file:
-            return [User.from_dict(u, self.products) for u in json.load(file)]
+        return self.users.load(self.products)
 
+    @METRICS.timed("save_users")
     def save_users(self):
-        with open("users.json", "w") as file:
-            json.dump([u.to_dict() for u in self.users], file, indent=4)
+        self.users.compact(wait=True)
 
     def load_admins(self):
-        if not os.path.exists("admins.json"):
-            return []
-        with open("admins.json", "r") as file:
-            return [Admin.from_dict(a) for a in json.load(file)]
+        return self.storage.load_admins()
 
     def save_admins(self):
-        with open("admins.json", "w") as file:
-            json.dump([a.to_dict() for a in self.admins], file, indent=4)
+        self.storage.save_admins(self.admins)
 
     def register_user(self):
         first_name = input("First Name: ")
@@ -444,15 +3489,29 @@ class ShoppingCartApp:
         address = input("Address: ")
         username = input("Username: ")
         password = input("Password: ")
+        if self.create_user(first_name, last_name, address, username, password):
+            print("\nUser registered successfully.")
+        else:
+            print("\nUsername already exists.")
+
+    def create_user(self, first_name, last_name, address, username, password):
+        if username in self.users:
+            return None
         user = User(first_name, last_name, address, username, password)
-        self.users.append(user)
-        self.save_users()
-        print("\nUser registered successfully.")
+        self.users.register(user)
+        return user
+
+    def authenticate_user(self, username, password):
+        user = self.users.get(username)
+        return user if user and user.password == password else None
+
+    def authenticate_admin(self, username, password):
+        return next((a for a in self.admins if a.username == username and a.password == password), None)
 
     def login_user(self):
         username = input("Username: ")
         password = input("Password: ")
-        user = next((u for u in self.users if u.username == username and u.password == password), None)
+        user = self.authenticate_user(username, password)
         if user:
             self.current_user = user
             print(f"\nWelcome {self.current_user.first_name} {self.current_user.last_name}")
@@ -463,7 +3522,7 @@ class ShoppingCartApp:
     def login_admin(self):
         username = input("Admin Username: ")
         password = input("Admin Password: ")
-        admin = next((a for a in self.admins if a.username == username and a.password == password), None)
+        admin = self.authenticate_admin(username, password)
         if admin:
             self.current_admin = admin
             print(f"\nWelcome Admin {self.current_admin.username}")
@@ -471,6 +3530,23 @@ class ShoppingCartApp:
         else:
             print("\nInvalid admin username or password.")
 
+    def browse_products(self):
+        page = 1
+        sort = "id"
+        while True:
+            print(self.listing.render(page, sort))
+            command = input("Enter a page number, a sort key (id/price/name), or press Enter to go back: ")
+            command = command.strip().lower()
+            if not command:
+                break
+            elif command.isdigit():
+                page = int(command)
+            elif command in ProductCatalog.SORT_KEYS:
+                sort = command
+                page = 1
+            else:
+                print("\nInvalid choice. Please try again.")
+
     def user_menu(self):
         print("==============================================================================")
         print("      ***************** WELCOME TO USER MENU *****************")
@@ -485,14 +3561,15 @@ class ShoppingCartApp:
             print("7. Checkout")
             print("8. View Purchase History")
             print("9. Logout")
+            print("10. Search Products")
             choice = input("Enter your choice: ")
             if choice == "1":
-                self.current_user.display_products(self.products)
+                self.browse_products()
             elif choice == "2":
                 try:
                     product_id = int(input("Enter product ID: "))
                     quantity = int(input("Enter quantity: "))
-                    product = next((p for p in self.products if p.product_id == product_id), None)
+                    product = self.products.get(product_id)
                     if product:
                         self.current_user.add_to_cart(product, quantity)
                     else:
@@ -501,6 +3578,7 @@ class ShoppingCartApp:
                     print("Invalid input.")
             elif choice == "3":
                 self.current_user.view_cart()
+                self.show_also_bought(self.current_user.cart)
             elif choice == "4":
                 try:
                     product_id = int(input("Enter product ID to remove: "))
@@ -517,11 +3595,57 @@ class ShoppingCartApp:
                 self.current_user.order_history.view_history()
             elif choice == "9":
                 self.current_user = None
-                self.save_users()
                 print("SUCCESSFULLY LOGGED OUT !")
+            elif choice == "10":
+                results = self.products.search(input("Search for: "))
+                if results:
+                    self.current_user.display_products(results)
+                else:
+                    print("\nNo matching products found.")
             else:
                 print("\nInvalid choice. Please try again.")
 
+    def load_recommendations(self):
+        with self._also_bought_lock:
+            if self.also_bought is None:
+                engine = AlsoBought.load(self.order_log.records())
+                engine.attach(self.order_log)
+                self.also_bought = engine
+        return self.also_bought
+
+    def recommendations(self):
+        return self.also_bought
+
+    def show_also_bought(self, cart):
+        engine = self.recommendations()
+        recommended = engine.recommend(product.name for product, _ in cart.items) if engine is not None else []
+        if recommended:
+            print("Customers who bought these items also bought: " + ", ".join(name for name, _ in recommended))
+
+    def sales_dashboard(self):
+        if self.analytics is None:
+            try:
+                from sales_analytics import SalesAnalytics
+            except ImportError:
+                print("\nThe sales dashboard requires numpy.")
+                return
+            self.analytics = SalesAnalytics.load(self.order_log.records())
+            self.analytics.attach(self.order_log)
+        print("\nTop Sellers")
+        print(render_table(self.analytics.top_sellers(10), ["Product", "Revenue ($)"]))
+        print("\nLast 7 Days")
+        print(render_table(self.analytics.daily_rollup(7), ["Date", "Units", "Revenue ($)"]))
+
+    def archive_orders(self):
+        while True:
+            try:
+                days = int(input("Archive orders older than how many days? (default 90): ") or 90)
+                break
+            except ValueError:
+                print("Invalid input. Please enter a whole number of days.")
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=days)).isoformat()
+        print(f"\nArchived {self.order_log.archive_before(cutoff)} orders placed before {cutoff[:10]}.")
+
     def admin_menu(self):
         print("==============================================================================")
         print("      ***************** WELCOME TO ADMIN MENU *****************")
@@ -532,25 +3656,47 @@ class ShoppingCartApp:
             print("3. Remove Product")
             print("4. Modify Product")
             print("5. Logout")
+            print("6. Sales Dashboard")
+            print("7. Import Products")
+            print("8. Export Products")
+            print("9. Archive Old Orders")
             choice = input("Enter your choice: ")
             if choice == "1":
-                self.current_admin.view_products(self.products)
+                self.browse_products()
             elif choice == "2":
                 self.current_admin.add_product(self.products)
-                self.save_products()
             elif choice == "3":
-                self.products = self.current_admin.remove_product(self.products)
-                self.save_products()
+                self.current_admin.remove_product(self.products)
             elif choice == "4":
                 self.current_admin.modify_product(self.products)
-                self.save_products()
             elif choice == "5":
                 self.current_admin = None
                 print("\nLogged out successfully.")
+            elif choice == "6":
+                self.sales_dashboard()
+            elif choice == "7":
+                self.current_admin.import_products(self.products)
+            elif choice == "8":
+                self.current_admin.export_products(self.products)
+            elif choice == "9":
+                self.archive_orders()
             else:
                 print("\nInvalid choice. Please try again.")
 
+    def session(self):
+        session = copy.copy(self)
+        session.current_user = None
+        session.current_admin = None
+        return session
+
     def main_menu(self):
+        threading.Thread(target=self.load_recommendations, daemon=True).start()
+        try:
+            self.run_menu()
+        finally:
+            self.close()
+
+    def run_menu(self):
         print("\nMESSAGE: The admin is Maria and the admin password is maria123\n\n ")
         print("==============================================================================")
         print("      ***************** WELCOME TO OUR SHOPPING CENTRE *****************")
@@ -575,7 +3721,6 @@ class ShoppingCartApp:
                     if self.current_admin:
                         self.admin_menu()
                 elif choice == "4":
-                    self.save_users()
                     print("==============================================================================")
                     print("                 THANK YOU FOR SHOPPING. HAVE A NICE DAY!!!")
                     print("==============================================================================")
@@ -584,8 +3729,14 @@ class ShoppingCartApp:
                     print("\nInvalid choice. Please try again.")
         except Exception as e:
             print(f"Error: {e}")
-        finally:
-            self.save_users()
+
+    def close(self):
+        self.writer.stop()
+        self.users.close()
+        self.order_log.close()
+        self.inventory.stop()
+        self.storage.save_state(self.products, self.users, self.order_log, self.inventory.held())
+        self.storage.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import datetime
+
+import numpy as np
+
+
+class SalesAnalytics:
+
+    SECONDS_PER_DAY = 86400
+
+    def __init__(self, capacity=1024):
+        self.product_names = []
+        self._product_codes = {}
+        self._size = 0
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.products = np.empty(capacity, dtype=np.int32)
+        self.quantities = np.empty(capacity, dtype=np.int64)
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self._product_revenue = np.zeros(0, dtype=np.float64)
+        self._product_units = np.zeros(0, dtype=np.int64)
+        self._daily = {}
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def load(cls, records):
+        analytics = cls()
+        timestamps, products, quantities, amounts = [], [], [], []
+        for _, purchase in records:
+            timestamp = cls.timestamp(purchase['date'])
+            if timestamp is None:
+                continue
+            for name, quantity, amount in purchase['items']:
+                timestamps.append(timestamp)
+                products.append(analytics.product_code(name))
+                quantities.append(quantity)
+                amounts.append(amount)
+        analytics._extend(np.array(timestamps, dtype=np.int64), np.array(products, dtype=np.int32),
+                          np.array(quantities, dtype=np.int64), np.array(amounts, dtype=np.float64))
+        analytics.rebuild_rollups()
+        return analytics
+
+    def attach(self, order_log):
+        order_log.listeners.append(self.record)
+
+    def record(self, username, purchase):
+        timestamp = self.timestamp(purchase['date'])
+        if timestamp is None or not purchase['items']:
+            return
+        codes = np.array([self.product_code(item[0]) for item in purchase['items']], dtype=np.int32)
+        quantities = np.array([item[1] for item in purchase['items']], dtype=np.int64)
+        amounts = np.array([item[2] for item in purchase['items']], dtype=np.float64)
+        self._extend(np.full(len(codes), timestamp, dtype=np.int64), codes, quantities, amounts)
+        self._grow_product_totals()
+        np.add.at(self._product_revenue, codes, amounts)
+        np.add.at(self._product_units, codes, quantities)
+        day = timestamp // self.SECONDS_PER_DAY
+        rollup = self._daily.setdefault(day, [0, 0.0])
+        rollup[0] += int(quantities.sum())
+        rollup[1] += float(amounts.sum())
+
+    def product_code(self, name):
+        code = self._product_codes.get(name)
+        if code is None:
+            code = self._product_codes[name] = len(self.product_names)
+            self.product_names.append(name)
+        return code
+
+    @staticmethod
+    def timestamp(date):
+        try:
+            return int(datetime.datetime.fromisoformat(date).replace(tzinfo=datetime.timezone.utc).timestamp())
+        except (TypeError, ValueError):
+            return None
+
+    def rebuild_rollups(self):
+        size = self._size
+        count = len(self.product_names)
+        self._product_revenue = np.bincount(self.products[:size], weights=self.amounts[:size], minlength=count)
+        self._product_units = np.bincount(self.products[:size], weights=self.quantities[:size],
+                                          minlength=count).astype(np.int64)
+        days, inverse = np.unique(self.timestamps[:size] // self.SECONDS_PER_DAY, return_inverse=True)
+        units = np.bincount(inverse, weights=self.quantities[:size], minlength=len(days))
+        revenue = np.bincount(inverse, weights=self.amounts[:size], minlength=len(days))
+        self._daily = {int(day): [int(u), float(r)] for day, u, r in zip(days, units, revenue)}
+
+    def revenue_by_product(self):
+        return dict(zip(self.product_names, self._product_revenue.tolist()))
+
+    def units_by_product(self):
+        return dict(zip(self.product_names, self._product_units.tolist()))
+
+    def top_sellers(self, k=10, by="revenue"):
+        totals = self._product_revenue if by == "revenue" else self._product_units
+        k = min(k, len(totals))
+        if not k:
+            return []
+        top = np.argpartition(-totals, k - 1)[:k]
+        top = top[np.argsort(-totals[top], kind="stable")]
+        return [(self.product_names[code], totals[code].item()) for code in top]
+
+    def daily_rollup(self, days=None):
+        rows = [(self.day_label(day), units, round(revenue, 2)) for day, (units, revenue) in sorted(self._daily.items())]
+        return rows[-days:] if days else rows
+
+    def revenue_per_product_per_day(self):
+        size = self._size
+        days, inverse = np.unique(self.timestamps[:size] // self.SECONDS_PER_DAY, return_inverse=True)
+        count = len(self.product_names)
+        matrix = np.bincount(inverse * count + self.products[:size], weights=self.amounts[:size],
+                             minlength=len(days) * count).reshape(len(days), count)
+        return [self.day_label(day) for day in days], list(self.product_names), matrix
+
+    def day_label(self, day):
+        return str(np.datetime64(int(day), "D"))
+
+    def _extend(self, timestamps, products, quantities, amounts):
+        needed = self._size + len(timestamps)
+        if needed > len(self.timestamps):
+            capacity = max(needed, 2 * len(self.timestamps))
+            for name in ("timestamps", "products", "quantities", "amounts"):
+                column = getattr(self, name)
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                setattr(self, name, grown)
+        end = self._size + len(timestamps)
+        self.timestamps[self._size:end] = timestamps
+        self.products[self._size:end] = products
+        self.quantities[self._size:end] = quantities
+        self.amounts[self._size:end] = amounts
+        self._size = end
+
+    def _grow_product_totals(self):
+        missing = len(self.product_names) - len(self._product_revenue)
+        if missing > 0:
+            self._product_revenue = np.concatenate([self._product_revenue, np.zeros(missing)])
+            self._product_units = np.concatenate([self._product_units, np.zeros(missing, dtype=np.int64)])
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import secrets
+import socket
+import time
+
+from online_shopping_cart import METRICS, Product, ShoppingCartApp
+
+
+class ServiceError(Exception):
+    pass
+
+
+class Session:
+
+    def __init__(self, token, kind, principal):
+        self.token = token
+        self.kind = kind
+        self.principal = principal
+        self.last_seen = time.monotonic()
+
+
+class ShoppingService:
+
+    def __init__(self, app=None, host="127.0.0.1", port=8765, session_timeout=1800):
+        self.app = app or ShoppingCartApp()
+        self.host = host
+        self.port = port
+        self.session_timeout = session_timeout
+        self.sessions = {}
+        self.handlers = {
+            "register": self.register,
+            "login": self.login,
+            "admin_login": self.admin_login,
+            "logout": self.logout,
+            "products": self.products,
+            "search": self.search,
+            "add_to_cart": self.add_to_cart,
+            "remove_from_cart": self.remove_from_cart,
+            "view_cart": self.view_cart,
+            "save_cart": self.save_cart,
+            "load_saved_cart": self.load_saved_cart,
+            "checkout": self.checkout,
+            "history": self.history,
+            "add_product": self.add_product,
+            "remove_product": self.remove_product,
+            "modify_product": self.modify_product,
+            "metrics": self.metrics
+        }
+        METRICS.gauge("shop_active_sessions", lambda: len(self.sessions))
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        expiry = asyncio.create_task(self.expire_sessions())
+        recommendations = asyncio.create_task(asyncio.to_thread(self.app.load_recommendations))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            expiry.cancel()
+            recommendations.cancel()
+            self.app.close()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self.dispatch(json.loads(line))
+                except ValueError:
+                    response = {"ok": False, "error": "Malformed request."}
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(self.session_timeout / 10)
+            cutoff = time.monotonic() - self.session_timeout
+            for token in [t for t, s in self.sessions.items() if s.last_seen < cutoff]:
+                del self.sessions[token]
+
+    def dispatch(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get("op"), str):
+            return {"ok": False, "error": "Malformed request."}
+        handler = self.handlers.get(request["op"])
+        if not handler:
+            return {"ok": False, "error": "Unknown operation."}
+        METRICS.inc("shop_requests_total", op=request["op"])
+        try:
+            return dict(handler(request), ok=True)
+        except ServiceError as e:
+            METRICS.inc("shop_request_errors_total", op=request["op"])
+            return {"ok": False, "error": str(e)}
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}
+        except Exception as e:
+            return {"ok": False, "error": f"Error: {e}"}
+
+    def session(self, request, kind):
+        session = self.sessions.get(request.get("session"))
+        if not session or session.kind != kind:
+            raise ServiceError("Not logged in.")
+        session.last_seen = time.monotonic()
+        return session.principal
+
+    def open_session(self, kind, principal):
+        token = secrets.token_hex(16)
+        self.sessions[token] = Session(token, kind, principal)
+        return token
+
+    def product(self, product_id):
+        product = self.app.products.get(int(product_id))
+        if not product:
+            raise ServiceError("Product not found.")
+        return product
+
+    @staticmethod
+    def cart_view(cart):
+        cart.quote()
+        return {
+            "items": [{"product_id": p.product_id, "name": p.name, "price": p.price, "quantity": q}
+                      for p, q in cart.items],
+            "total_price": cart.total
+        }
+
+    def register(self, request):
+        user = self.app.create_user(request["first_name"], request["last_name"], request["address"],
+                                    request["username"], request["password"])
+        if not user:
+            raise ServiceError("Username already exists.")
+        return {}
+
+    def login(self, request):
+        user = self.app.authenticate_user(request["username"], request["password"])
+        if not user:
+            raise ServiceError("Invalid username or password.")
+        return {"session": self.open_session("user", user)}
+
+    def admin_login(self, request):
+        admin = self.app.authenticate_admin(request["username"], request["password"])
+        if not admin:
+            raise ServiceError("Invalid admin username or password.")
+        return {"session": self.open_session("admin", admin)}
+
+    def logout(self, request):
+        self.sessions.pop(request.get("session"), None)
+        return {}
+
+    def products(self, request):
+        offset = int(request.get("offset", 0))
+        limit = int(request.get("limit", 50))
+        products = self.app.products.page(offset, limit, request.get("sort", "id"), bool(request.get("descending")))
+        return {"products": [p.to_dict() for p in products], "total": len(self.app.products)}
+
+    def search(self, request):
+        results = self.app.products.search(request["query"], int(request.get("limit", 10)))
+        return {"products": [p.to_dict() for p in results]}
+
+    def add_to_cart(self, request):
+        user = self.session(request, "user")
+        product = self.product(request["product_id"])
+        quantity = int(request["quantity"])
+        if quantity <= 0:
+            raise ServiceError("Quantity must be a positive number.")
+        if user.cart.add_many([(product, quantity)]):
+            raise ServiceError(f"Sorry, only {product.stock} items in stock.")
+        return self.cart_view(user.cart)
+
+    def remove_from_cart(self, request):
+        user = self.session(request, "user")
+        if not user.cart.remove_many([int(request["product_id"])]):
+            raise ServiceError("Product not found in cart.")
+        return self.cart_view(user.cart)
+
+    def view_cart(self, request):
+        cart = self.session(request, "user").cart
+        engine = self.app.recommendations()
+        recommended = engine.recommend(product.name for product, _ in cart.items) if engine is not None else []
+        return dict(self.cart_view(cart), also_bought=[name for name, _ in recommended])
+
+    def save_cart(self, request):
+        user = self.session(request, "user")
+        user.cart.move_to(user.saved_cart)
+        return {}
+
+    def load_saved_cart(self, request):
+        user = self.session(request, "user")
+        if not user.saved_cart.lines:
+            raise ServiceError("No saved cart found.")
+        user.saved_cart.move_to(user.cart)
+        return self.cart_view(user.cart)
+
+    def checkout(self, request):
+        user = self.session(request, "user")
+        if not user.cart.lines:
+            raise ServiceError("Your cart is empty.")
+        if user.cart.stale_quotes():
+            user.cart.quote()
+            raise ServiceError(f"Prices have changed since you last viewed your cart. "
+                               f"The total is now ${user.cart.total}.")
+        error = user.payment_error(str(request["card_number"]), str(request["expiry_date"]), str(request["cvv"]))
+        if error:
+            raise ServiceError(error)
+        purchase = user.place_order(request.get("feedback", ""))
+        if not purchase:
+            raise ServiceError("Some items in your cart are no longer in stock.")
+        return {"purchase": purchase}
+
+    def history(self, request):
+        user = self.session(request, "user")
+        offset = int(request.get("offset", 0))
+        limit = int(request.get("limit", 20))
+        return {"purchases": list(user.order_history.purchases(offset, limit))}
+
+    def add_product(self, request):
+        self.session(request, "admin")
+        products = self.app.products
+        product_id = int(request["product_id"]) if "product_id" in request else products.next_id()
+        product = products.add(Product(product_id, request["name"], float(request["price"]),
+                                       request.get("description", ""), int(request["stock"])))
+        return {"product": product.to_dict()}
+
+    def remove_product(self, request):
+        self.session(request, "admin")
+        if not self.app.products.remove(int(request["product_id"])):
+            raise ServiceError("Product not found.")
+        return {}
+
+    def modify_product(self, request):
+        self.session(request, "admin")
+        product = self.product(request["product_id"])
+        self.app.products.update(
+            product,
+            name=request.get("name"),
+            price=float(request["price"]) if "price" in request else None,
+            description=request.get("description"),
+            stock=int(request["stock"]) if "stock" in request else None
+        )
+        return {"product": product.to_dict()}
+
+
+    def metrics(self, request):
+        self.session(request, "admin")
+        if request.get("format") == "prometheus":
+            return {"metrics": METRICS.prometheus()}
+        return {"metrics": METRICS.snapshot()}
+
+
+class ShoppingServiceClient:
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile("rwb")
+        self.session = None
+
+    def request(self, op, **fields):
+        if self.session and "session" not in fields:
+            fields["session"] = self.session
+        self.file.write((json.dumps(dict(fields, op=op)) + "\n").encode())
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if op in ("login", "admin_login") and response.get("ok"):
+            self.session = response["session"]
+        elif op == "logout":
+            self.session = None
+        return response
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(ShoppingService().serve())
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from bulk_orders import BulkCheckout
+from online_shopping_cart import JSONStorage, ShoppingCartApp
+
+CARD = {"card_number": "1234567890123", "expiry_date": "1230", "cvv": "123"}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = ShoppingCartApp(JSONStorage(str(tmp_path)))
+    app.create_user("Ada", "Lovelace", "London", "ada", "pw")
+    yield app
+    app.close()
+
+
+def run(app, tmp_path, orders, workers=2):
+    path = tmp_path / "orders.jsonl"
+    path.write_text("".join((order if isinstance(order, str) else json.dumps(order)) + "\n" for order in orders))
+    return BulkCheckout(app, workers, batch_size=100).run(str(path))
+
+
+def test_bad_lines_are_rejected_without_aborting_the_batch(app, tmp_path):
+    good = dict(CARD, username="ada", items=[{"product_id": 5, "quantity": 1}])
+    reports = run(app, tmp_path, [
+        good,
+        dict(good, username=["ada"]),
+        dict(good, date=17),
+        dict(good, date="last tuesday"),
+        "[1]",
+        dict(good, items=[{"product_id": 5, "quantity": 0}]),
+        dict(good, username="nobody"),
+        dict(good, date="2001-01-01")
+    ])
+    assert reports[0]["accepted"] == 2
+    assert reports[0]["rejections"] == {"Malformed order.": 2, "Invalid date.": 2, "Invalid quantity.": 1,
+                                        "Unknown user.": 1}
+    assert app.products.get(5).stock == 3
+    dates = [purchase["date"] for purchase in app.users.get("ada").order_history.purchases()]
+    assert len(dates) == 2 and all(date > "2001-01-01" for date in dates)
+
+
+def test_stock_is_not_oversold_across_partitions(app, tmp_path):
+    stock = app.products.get(5).stock
+    order = dict(CARD, username="ada", items=[{"product_id": 5, "quantity": 1}, {"product_id": 2, "quantity": 1}])
+    reports = run(app, tmp_path, [order] * (stock + 3), workers=3)
+    assert reports[0]["accepted"] == stock
+    assert reports[0]["rejections"] == {"Insufficient stock.": 3}
+    assert app.products.get(5).stock == 0
+
+
+def test_expired_holds_are_reserved_again_before_commit(app, tmp_path):
+    commit_all = app.inventory.commit_all
+    expired = []
+
+    def expire_first(holds):
+        if not expired:
+            expired.append(holds[0])
+            app.inventory.release(holds[0])
+        return commit_all(holds)
+
+    app.inventory.commit_all = expire_first
+    reports = run(app, tmp_path, [dict(CARD, username="ada", items=[{"product_id": 5, "quantity": 2}])])
+    assert reports[0]["accepted"] == 1
+    assert app.products.get(5).stock == 3
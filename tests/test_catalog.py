@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from online_shopping_cart import Cart, Product, ProductCatalog
+
+
+def numbered_catalog(first, last, compact=False):
+    return ProductCatalog([Product(i, f"Product {i}", 1.0, "", 1) for i in range(first, last)], compact=compact)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_iteration_survives_concurrent_changes(compact):
+    catalog = numbered_catalog(1000, 3000, compact)
+    catalog.ITER_CHUNK = 100
+    seen = []
+    for product in catalog:
+        seen.append(product.product_id)
+        if len(seen) == 150:
+            catalog.add(Product(5, "Low id", 1.0, "", 1))
+            catalog.remove(2999)
+    assert seen == list(range(1000, 2999))
+
+
+def test_next_id_is_unique_across_threads():
+    catalog = numbered_catalog(1, 10)
+    ids = []
+
+    def allocate():
+        ids.extend(catalog.next_id() for _ in range(2000))
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == len(ids) == 16000
+
+
+def test_removed_compact_product_keeps_its_values_after_vacuum():
+    catalog = numbered_catalog(1, 10, compact=True)
+    cart = Cart()
+    product = catalog.get(3)
+    assert not cart.add_many([(product, 1)])
+    catalog.remove(3)
+    catalog._by_id.vacuum()
+    assert cart.to_dict()["items"][0][0] == {"product_id": 3, "name": "Product 3", "price": 1.0,
+                                             "description": "", "stock": 0}
+    catalog.add(product)
+    assert catalog.get(3).name == "Product 3"
+
+
+def test_deferred_import_writes_chunks_as_it_reads_them():
+    catalog = numbered_catalog(1, 3)
+    seen = []
+
+    def feed():
+        for product_id in range(100, 400):
+            if product_id % 100 == 0 and product_id > 100:
+                seen.append(catalog.get(product_id - 1) is not None)
+            yield Product(product_id, f"Imported {product_id}", 400 - product_id, "", 1)
+
+    assert catalog.upsert_many(feed(), chunk_size=100) == (300, 0)
+    assert seen == [True, True]
+    prices = [product.price for product in catalog.by_price_range(0, 1000)]
+    assert prices == sorted(prices) and len(prices) == 302
+
+
+def test_changes_during_a_deferred_import_wait_for_the_reindex():
+    catalog = numbered_catalog(1, 3)
+    started = threading.Event()
+    resume = threading.Event()
+    removed = []
+
+    def feed():
+        yield from (Product(product_id, "Imported", 1.0, "", 1) for product_id in range(100, 200))
+        started.set()
+        resume.wait(5)
+        yield from (Product(product_id, "Imported", 2.0, "", 1) for product_id in range(200, 300))
+
+    importer = threading.Thread(target=catalog.upsert_many, args=(feed(),), kwargs={"chunk_size": 100})
+    importer.start()
+    started.wait(5)
+    remover = threading.Thread(target=lambda: removed.append(catalog.remove(150)))
+    remover.start()
+    remover.join(0.2)
+    assert remover.is_alive()
+    assert [product.product_id for product in catalog.page(0, 5)] == [1, 2]
+    resume.set()
+    importer.join(5)
+    remover.join(5)
+    assert removed[0].product_id == 150
+    assert 150 not in catalog and len(catalog.page(0, 1000, sort="price")) == 201
@@ -0,0 +1,58 @@
+import pytest
+
+from online_shopping_cart import Cart, InventoryManager, JSONStorage, Product, SQLiteStorage, ShoppingCartApp
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def storage_factory(request, tmp_path):
+    if request.param == "json":
+        return lambda: JSONStorage(str(tmp_path))
+    return lambda: SQLiteStorage(str(tmp_path / "shop.db"))
+
+
+def test_restored_cart_can_check_out_held_stock(storage_factory):
+    app = ShoppingCartApp(storage_factory())
+    app.create_user("Ada", "Lovelace", "London", "ada", "pw")
+    app.create_user("Alan", "Turing", "Bletchley", "alan", "pw")
+    camera = app.products.get(5)
+    assert camera.stock == 5
+    assert not app.users.get("ada").cart.add_many([(camera, 4)])
+    assert not app.users.get("alan").cart.add_many([(camera, 1)])
+    assert app.users.get("alan").place_order("")
+    app.close()
+
+    app = ShoppingCartApp(storage_factory())
+    assert app.products.get(5).stock == 4
+    assert app.users.get("ada").place_order("")
+    assert app.products.get(5).stock == 0
+    app.close()
+
+    app = ShoppingCartApp(storage_factory())
+    assert app.products.get(5).stock == 0
+    app.close()
+
+
+def test_failed_cart_commit_leaves_no_stock_committed():
+    inventory = InventoryManager()
+    laptop = Product(1, "Laptop", 999.99, "", 5)
+    mouse = Product(2, "Mouse", 19.99, "", 1)
+    cart = Cart(inventory)
+    assert not cart.add_many([(laptop, 2), (mouse, 1)])
+    renew = inventory.renew
+    competitors = []
+
+    def renew_then_expire(hold, ttl=None):
+        renewed = renew(hold, ttl)
+        if hold.product is mouse:
+            inventory.release(hold)
+            competitors.append(inventory.reserve(mouse, 1))
+        return renewed
+
+    inventory.renew = renew_then_expire
+    assert not cart.commit()
+    assert (laptop.stock, mouse.stock) == (3, 0)
+
+    inventory.renew = renew
+    inventory.release_many(competitors)
+    assert cart.commit()
+    assert (laptop.stock, mouse.stock) == (3, 0)
@@ -0,0 +1,26 @@
+import os
+import signal
+import time
+
+import pytest
+
+from online_shopping_cart import Metrics
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="needs SIGUSR1")
+def test_dump_on_signal_while_metrics_lock_is_held(tmp_path):
+    metrics = Metrics(enabled=True)
+    metrics.inc("shop_requests_total", op="login")
+    path = str(tmp_path / "metrics.json")
+    previous = signal.getsignal(signal.SIGUSR1)
+    metrics.dump_on_signal(path)
+    try:
+        with metrics._lock:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.05)
+        deadline = time.monotonic() + 5
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+    assert os.path.exists(path)
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+
+from online_shopping_cart import OrderArchive, OrderLog
+
+ORDERS = [
+    ("ada", "2023-01-05T10:00:00"),
+    ("alan", "2023-02-11T12:30:00"),
+    ("ada", "2023-03-20T09:15:00"),
+    ("alan", "2024-04-02T16:45:00"),
+    ("ada", "2024-05-18T11:00:00"),
+]
+
+
+def purchase(date):
+    return {"date": date, "items": [["Laptop", 1, 999.99]], "total_price": 999.99, "feedback": ""}
+
+
+def open_log(directory):
+    archive = OrderArchive(str(directory / "orders.archive.idx"), str(directory / "orders-{:05d}.arc"))
+    order_log = OrderLog(str(directory / "orders.log"), str(directory / "orders.idx"), archive=archive)
+    order_log.open()
+    return order_log
+
+
+def filled_log(directory):
+    order_log = open_log(directory)
+    for username, date in ORDERS:
+        order_log.append(username, purchase(date))
+    order_log.sync()
+    return order_log
+
+
+def dates(records):
+    return sorted(record['date'] for record in records)
+
+
+def test_archive_rolls_old_orders_into_a_segment(tmp_path):
+    order_log = filled_log(tmp_path)
+    assert order_log.archive_before("2024-01-01") == 3
+
+    assert os.path.exists(tmp_path / "orders-00001.arc")
+    assert dates(order_log.orders_for("ada")) == ["2024-05-18T11:00:00"]
+    assert dates(order_log.archive.orders_for("ada")) == ["2023-01-05T10:00:00", "2023-03-20T09:15:00"]
+    assert order_log.archive.count("alan") == 1
+    assert dates(record for _, record in order_log.records()) == sorted(date for _, date in ORDERS)
+    order_log.close()
+
+    order_log = open_log(tmp_path)
+    assert order_log.count("ada") == 1
+    assert order_log.archive.count("ada") == 2
+    order_log.append("alan", purchase("2024-06-01T08:00:00"))
+    assert dates(order_log.orders_for("alan")) == ["2024-04-02T16:45:00", "2024-06-01T08:00:00"]
+    order_log.close()
+
+
+def test_archive_with_nothing_old_enough_is_a_no_op(tmp_path):
+    order_log = filled_log(tmp_path)
+    assert order_log.archive_before("2000-01-01") == 0
+    assert not os.path.exists(tmp_path / "orders-00001.arc")
+    assert order_log.count("ada") == 3
+    order_log.close()
+
+
+def test_recovery_rolls_back_an_uncommitted_archive(tmp_path, monkeypatch):
+    order_log = filled_log(tmp_path)
+
+    def crash(number, blocks):
+        raise OSError("crashed before commit")
+
+    monkeypatch.setattr(order_log.archive, "commit", crash)
+    with pytest.raises(OSError):
+        order_log.archive_before("2024-01-01")
+    order_log.close()
+    assert os.path.exists(tmp_path / "orders.log.next")
+    assert os.path.exists(tmp_path / "orders-00001.arc")
+
+    order_log = open_log(tmp_path)
+    assert not os.path.exists(tmp_path / "orders.log.next")
+    assert not os.path.exists(tmp_path / "orders.idx.next")
+    assert not os.path.exists(tmp_path / "orders-00001.arc")
+    assert order_log.count("ada") == 3
+    assert order_log.archive.count("ada") == 0
+    order_log.close()
+
+
+def test_recovery_rolls_forward_a_committed_archive(tmp_path, monkeypatch):
+    order_log = filled_log(tmp_path)
+    replace = os.replace
+
+    def crash(source, target):
+        if str(source).endswith(".next"):
+            raise OSError("crashed before rename")
+        return replace(source, target)
+
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        order_log.archive_before("2024-01-01")
+    monkeypatch.undo()
+    assert os.path.exists(tmp_path / "orders.log.next")
+
+    order_log = open_log(tmp_path)
+    assert not os.path.exists(tmp_path / "orders.log.next")
+    assert not os.path.exists(tmp_path / "orders.idx.next")
+    assert dates(order_log.orders_for("ada")) == ["2024-05-18T11:00:00"]
+    assert order_log.archive.count("ada") == 2
+    assert dates(record for _, record in order_log.records()) == sorted(date for _, date in ORDERS)
+    order_log.close()
+
+
+def test_archive_index_drops_uncommitted_blocks(tmp_path):
+    order_log = filled_log(tmp_path)
+    order_log.archive_before("2024-01-01")
+    order_log.close()
+    with open(tmp_path / "orders.archive.idx", "a") as file:
+        file.write('["ada", 2, 0, 10, 1]\n["alan", 2, 10')
+    committed = os.path.getsize(tmp_path / "orders.archive.idx")
+
+    order_log = open_log(tmp_path)
+    assert order_log.archive.count("ada") == 2
+    assert os.path.getsize(tmp_path / "orders.archive.idx") < committed
+    order_log.close()
+
+
+def test_archive_takes_old_orders_after_a_newer_one(tmp_path):
+    order_log = open_log(tmp_path)
+    order_log.append("ada", purchase("2024-05-18T11:00:00"))
+    order_log.append("alan", purchase("2020-01-01T00:00:00"))
+    order_log.append("ada", purchase("2024-06-01T08:00:00"))
+    assert order_log.archive_before("2024-01-01") == 1
+    assert dates(order_log.archive.orders_for("alan")) == ["2020-01-01T00:00:00"]
+    assert order_log.count("alan") == 0
+    assert dates(order_log.orders_for("ada")) == ["2024-05-18T11:00:00", "2024-06-01T08:00:00"]
+    order_log.close()
@@ -0,0 +1,115 @@
+import os
+
+from online_shopping_cart import JSONStorage, Product, ProductCatalog, User, UserDirectory, WriteBehind
+
+
+def open_users(directory, **kwargs):
+    return UserDirectory(str(directory / "users.json"), str(directory / "users.idx"), str(directory / "users.journal"),
+                         **kwargs).load(None)
+
+
+def test_user_journal_replays_after_restart(tmp_path):
+    users = open_users(tmp_path)
+    users.register(User("Ada", "Lovelace", "London", "ada", "pw"))
+    users.register(User("Alan", "Turing", "Bletchley", "alan", "pw"))
+    users.close()
+
+    users = open_users(tmp_path)
+    assert users.usernames() == {"ada", "alan"}
+    assert users.get("ada").address == "London"
+    users.close()
+
+
+def test_user_journal_truncates_torn_record(tmp_path):
+    users = open_users(tmp_path)
+    users.register(User("Ada", "Lovelace", "London", "ada", "pw"))
+    users.close()
+    valid_bytes = os.path.getsize(tmp_path / "users.journal")
+    with open(tmp_path / "users.journal", "ab") as file:
+        file.write(b'{"op": "register", "user": {"username": "tor')
+
+    users = open_users(tmp_path)
+    assert os.path.getsize(tmp_path / "users.journal") == valid_bytes
+    assert users.usernames() == {"ada"}
+    users.register(User("Alan", "Turing", "Bletchley", "alan", "pw"))
+    users.close()
+
+    users = open_users(tmp_path)
+    assert users.get("alan").first_name == "Alan"
+    users.close()
+
+
+def test_write_behind_retries_failed_user_write(tmp_path, monkeypatch):
+    users = open_users(tmp_path)
+    users.writer = writer = WriteBehind(interval=60)
+    append = UserDirectory._append
+    failures = []
+
+    def failing_append(self, username, record):
+        if not failures:
+            failures.append(username)
+            raise OSError("disk full")
+        return append(self, username, record)
+
+    monkeypatch.setattr(UserDirectory, "_append", failing_append)
+    users.register(User("Ada", "Lovelace", "London", "ada", "pw"))
+    writer.flush()
+    assert failures == ["ada"]
+    assert len(writer) == 1
+    writer.flush()
+    assert len(writer) == 0
+    users.close()
+
+    users = open_users(tmp_path)
+    assert users.get("ada").last_name == "Lovelace"
+    users.close()
+
+
+def catalog():
+    return ProductCatalog([Product(1, "Laptop", 999.99, "", 10), Product(2, "Mouse", 19.99, "", 50)])
+
+
+def test_product_journal_replays_changed_rows(tmp_path):
+    storage = JSONStorage(str(tmp_path), snapshot=False)
+    products = catalog()
+    storage.save_products(products)
+    before = os.stat(tmp_path / "products.json")
+
+    products.get(1).stock = 7
+    storage.save_products(products, {1})
+    products.remove(2)
+    products.add(Product(3, "Keyboard", 49.99, "", 5))
+    storage.save_products(products, {2, 3})
+
+    after = os.stat(tmp_path / "products.json")
+    assert (after.st_size, after.st_mtime_ns) == (before.st_size, before.st_mtime_ns)
+    loaded = {p.product_id: p.stock for p in storage.load_products()}
+    assert loaded == {1: 7, 3: 5}
+
+
+def test_product_journal_folds_into_full_rewrite(tmp_path):
+    storage = JSONStorage(str(tmp_path), snapshot=False)
+    products = catalog()
+    storage.save_products(products)
+    products.get(1).stock = 7
+    storage.save_products(products, {1})
+
+    storage.save_products(products, None, {1: 2})
+    assert not os.path.exists(tmp_path / "products.journal")
+    assert {p.product_id: p.stock for p in storage.load_products()} == {1: 9, 2: 50}
+
+
+def test_stale_product_journal_is_ignored(tmp_path):
+    storage = JSONStorage(str(tmp_path), snapshot=False)
+    products = catalog()
+    storage.save_products(products)
+    products.get(1).stock = 7
+    storage.save_products(products, {1})
+    with open(tmp_path / "products.journal", "rb") as file:
+        stale = file.read()
+
+    products.get(1).stock = 3
+    storage.save_products(products)
+    with open(tmp_path / "products.journal", "wb") as file:
+        file.write(stale)
+    assert {p.product_id: p.stock for p in storage.load_products()} == {1: 3, 2: 50}
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from online_shopping_cart import JSONStorage, ShoppingCartApp
+from shopping_service import ShoppingService
+from user_shards import ShardRouter
+
+MALFORMED = [[1], "x", 7, None, {"op": []}, {"op": {"a": 1}}, {}]
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = ShoppingService(ShoppingCartApp(JSONStorage(str(tmp_path))))
+    yield service
+    service.app.close()
+
+
+@pytest.mark.parametrize("request_body", MALFORMED)
+def test_service_rejects_requests_that_are_not_objects(service, request_body):
+    assert service.dispatch(request_body) == {"ok": False, "error": "Malformed request."}
+
+
+@pytest.mark.parametrize("line", [b"[1]\n", b'"x"\n', b'{"op": []}\n'])
+def test_router_rejects_requests_that_are_not_objects(line):
+    router = ShardRouter([("127.0.0.1", 1)])
+    assert asyncio.run(router.dispatch(None, line)) == {"ok": False, "error": "Malformed request."}
+
+
+def test_view_cart_shows_nothing_until_recommendations_are_loaded(service):
+    app = service.app
+    app.create_user("Ada", "Lovelace", "London", "ada", "pw")
+    user = app.users.get("ada")
+    assert not user.cart.add_many([(app.products.get(1), 1), (app.products.get(2), 1)])
+    assert user.place_order("")
+    app.writer.flush()
+    session = service.dispatch({"op": "login", "username": "ada", "password": "pw"})["session"]
+    service.dispatch({"op": "add_to_cart", "session": session, "product_id": 1, "quantity": 1})
+    assert service.dispatch({"op": "view_cart", "session": session})["also_bought"] == []
+    assert app.recommendations() is None
+    app.load_recommendations()
+    assert service.dispatch({"op": "view_cart", "session": session})["also_bought"] == ["Smartphone"]
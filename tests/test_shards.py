@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from online_shopping_cart import JSONStorage, ShoppingCartApp
+from user_shards import ShardRouter, ShardService
+
+
+@pytest.fixture
+def shard(tmp_path):
+    service = ShardService(ShoppingCartApp(JSONStorage(str(tmp_path))), token="secret")
+    yield service
+    service.app.close()
+
+
+def test_stock_operations_require_the_internal_token(shard):
+    for token in (None, "", "wrong"):
+        request = {"op": "receive_stock", "product_id": 5, "quantity": 100}
+        if token is not None:
+            request["token"] = token
+        assert shard.dispatch(request) == {"ok": False, "error": "Not authorized."}
+    assert shard.app.products.get(5).stock == 5
+    assert shard.dispatch({"op": "lend_stock", "token": "secret", "product_id": 5, "quantity": 3}) == \
+        {"ok": True, "lent": 3}
+    assert shard.app.products.get(5).stock == 2
+
+
+class FailingLinks:
+
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, shard, request):
+        self.calls.append((shard, request["op"], request.get("quantity")))
+        if request["op"] == "lend_stock":
+            return {"ok": True, "lent": 2}
+        if shard == 0:
+            raise ConnectionError("shard 0 closed the connection")
+        return {"ok": True}
+
+
+def test_borrow_returns_units_to_the_lender_when_receive_fails():
+    router = ShardRouter([("127.0.0.1", 1), ("127.0.0.1", 2)], token="secret")
+    links = FailingLinks()
+    assert asyncio.run(router.borrow(links, 0, 5, 2)) == 0
+    assert links.calls == [(1, "lend_stock", 2), (0, "receive_stock", 2), (1, "receive_stock", 2)]
@@ -0,0 +1,108 @@
+import os
+
+from online_shopping_cart import JSONStorage, Product, ShoppingCartApp
+
+
+def make_store(directory):
+    app = ShoppingCartApp(JSONStorage(str(directory)))
+    app.create_user("Ada", "Lovelace", "London", "ada", "pw")
+    app.products.get(1).stock = 7
+    app.products.mark_dirty({1})
+    app.close()
+
+
+def test_snapshot_is_written_on_close_and_used_when_fresh(tmp_path):
+    make_store(tmp_path)
+    assert os.path.exists(tmp_path / "state.snap")
+
+    storage = JSONStorage(str(tmp_path))
+    snapshot = storage.snapshot()
+    assert snapshot.current("catalog", storage.catalog_source())
+    assert storage.load_catalog().get(1).stock == 7
+    storage.close()
+
+
+def test_snapshot_catalog_is_ignored_after_products_json_changes(tmp_path):
+    make_store(tmp_path)
+    JSONStorage(str(tmp_path), snapshot=False).save_products(
+        [Product(1, "Laptop", 899.99, "Refurbished", 2), Product(9, "Dock", 99.99, "", 4)])
+
+    storage = JSONStorage(str(tmp_path))
+    assert not storage.snapshot().current("catalog", storage.catalog_source())
+    catalog = storage.load_catalog()
+    assert [(p.product_id, p.price, p.stock) for p in catalog] == [(1, 899.99, 2), (9, 99.99, 4)]
+    storage.close()
+
+
+def test_snapshot_catalog_is_ignored_after_journaled_changes(tmp_path):
+    make_store(tmp_path)
+    storage = JSONStorage(str(tmp_path))
+    catalog = storage.load_catalog()
+    catalog.get(1).stock = 3
+    storage.save_products(catalog, {1})
+    storage.close()
+    assert os.path.exists(tmp_path / "products.journal")
+
+    storage = JSONStorage(str(tmp_path))
+    assert not storage.snapshot().current("catalog", storage.catalog_source())
+    assert storage.load_catalog().get(1).stock == 3
+    storage.close()
+
+
+def compacted_store(directory):
+    make_store(directory)
+    app = ShoppingCartApp(JSONStorage(str(directory)))
+    app.users.compact(wait=True)
+    app.close()
+
+
+def test_snapshot_users_are_used_when_fresh(tmp_path):
+    compacted_store(tmp_path)
+    app = ShoppingCartApp(JSONStorage(str(tmp_path)))
+    snapshot = app.storage.snapshot()
+    assert snapshot.users(str(tmp_path / "users.json"), app.users.snapshot_seq) is not None
+    assert snapshot.users(str(tmp_path / "users.json"), app.users.snapshot_seq + 1) is None
+    assert app.users.get("ada").first_name == "Ada"
+    app.close()
+
+
+def test_snapshot_users_are_ignored_after_users_json_changes(tmp_path):
+    compacted_store(tmp_path)
+    app = ShoppingCartApp(JSONStorage(str(tmp_path)), flush_interval=60)
+    app.create_user("Alan", "Turing", "Bletchley", "alan", "pw")
+    app.flush()
+    app.users.compact(wait=True)
+    seq = app.users.snapshot_seq
+    app.writer.stop()
+    app.users.close()
+    app.order_log.close()
+
+    storage = JSONStorage(str(tmp_path))
+    assert storage.snapshot().users(str(tmp_path / "users.json"), seq) is None
+    storage.close()
+    app = ShoppingCartApp(JSONStorage(str(tmp_path)))
+    assert app.users.get("alan").last_name == "Turing"
+    assert app.users.get("ada").last_name == "Lovelace"
+    app.close()
+
+
+def test_snapshot_can_be_disabled(tmp_path):
+    app = ShoppingCartApp(JSONStorage(str(tmp_path), snapshot=False))
+    app.products.mark_dirty(None)
+    app.close()
+    assert not os.path.exists(tmp_path / "state.snap")
+
+
+def test_snapshot_catalog_is_ignored_after_same_size_rewrite_in_same_tick(tmp_path):
+    make_store(tmp_path)
+    before = os.stat(tmp_path / "products.json")
+    storage = JSONStorage(str(tmp_path), snapshot=False)
+    products = list(storage.load_products())
+    products[0].stock = 8
+    storage.save_products(products)
+    os.utime(tmp_path / "products.json", ns=(before.st_atime_ns, before.st_mtime_ns))
+    assert os.path.getsize(tmp_path / "products.json") == before.st_size
+
+    storage = JSONStorage(str(tmp_path))
+    assert storage.load_catalog().get(1).stock == 8
+    storage.close()
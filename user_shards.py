@@ -0,0 +1,416 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import time
+import zlib
+
+from online_shopping_cart import JSONStorage, Product, ShoppingCartApp
+from shopping_service import ServiceError, ShoppingService
+
+USER_OPS = ("add_to_cart", "remove_from_cart", "view_cart", "save_cart", "load_saved_cart", "checkout", "history")
+OUT_OF_STOCK = ("Sorry, only ", "Some items in your cart are no longer in stock.")
+
+
+def shard_for(username, shards):
+    return zlib.crc32(username.encode()) % shards
+
+
+def split_stock(stock, shards, shard):
+    return stock // shards + (1 if shard < stock % shards else 0)
+
+
+def shard_directory(directory, shard):
+    return os.path.join(directory, f"shard-{shard:02d}")
+
+
+def shard_count(directory):
+    with open(os.path.join(directory, "shards.json"), "r") as file:
+        return json.load(file)["shards"]
+
+
+def shard_storages(directory):
+    if not os.path.exists(os.path.join(directory, "shards.json")):
+        return [JSONStorage(directory)]
+    return [JSONStorage(shard_directory(directory, shard)) for shard in range(shard_count(directory))]
+
+
+def reshard(source, target, shards):
+    if os.path.abspath(source) == os.path.abspath(target):
+        raise ValueError("Reshard into a new directory and swap it in afterwards.")
+    sources = shard_storages(source)
+    products = {}
+    for storage in sources:
+        for product in storage.load_products():
+            current = products.get(product.product_id)
+            if current:
+                current.stock += product.stock
+            else:
+                products[product.product_id] = product
+    catalog = sorted(products.values(), key=lambda p: p.product_id) or ShoppingCartApp.DEFAULT_PRODUCTS
+    admins = list(sources[0].load_admins())
+    for shard in range(shards):
+        directory = shard_directory(target, shard)
+        os.makedirs(directory, exist_ok=True)
+        JSONStorage(directory).import_records(
+            [Product(p.product_id, p.name, p.price, p.description, split_stock(p.stock, shards, shard))
+             for p in catalog],
+            admins,
+            (data for storage in sources for data in storage.user_records()
+             if shard_for(data['username'], shards) == shard),
+            ((username, purchase) for storage in sources for username, purchase in storage.order_records()
+             if shard_for(username, shards) == shard)
+        )
+    with open(os.path.join(target, "shards.json"), "w") as file:
+        json.dump({"shards": shards}, file)
+
+
+def run_shard(directory, host, port, token=None):
+    async def serve():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        await ShardService(ShoppingCartApp(JSONStorage(directory)), host, port, token=token).serve()
+
+    try:
+        asyncio.run(serve())
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+
+
+def run_router(addresses, host, port, token=None):
+    async def serve():
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        await ShardRouter(addresses, host, port, token).serve()
+
+    try:
+        asyncio.run(serve())
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+
+
+class ShardService(ShoppingService):
+
+    def __init__(self, app=None, host="127.0.0.1", port=8765, session_timeout=1800, token=None):
+        super().__init__(app, host, port, session_timeout)
+        self.token = token
+        self.handlers["lend_stock"] = self.lend_stock
+        self.handlers["receive_stock"] = self.receive_stock
+
+    def internal(self, request):
+        if not self.token or not secrets.compare_digest(str(request.get("token", "")), self.token):
+            raise ServiceError("Not authorized.")
+
+    def lend_stock(self, request):
+        self.internal(request)
+        product = self.product(request["product_id"])
+        lent = self.app.inventory.withdraw(product, int(request["quantity"]))
+        if lent:
+            self.app.products.mark_dirty({product.product_id})
+        return {"lent": lent}
+
+    def receive_stock(self, request):
+        self.internal(request)
+        product = self.product(request["product_id"])
+        quantity = int(request["quantity"])
+        if quantity <= 0:
+            raise ServiceError("Quantity must be a positive number.")
+        self.app.inventory.restock(product, quantity)
+        self.app.products.mark_dirty({product.product_id})
+        return {"product": product.to_dict()}
+
+
+class ShardCluster:
+
+    def __init__(self, directory, host="127.0.0.1", base_port=8766):
+        self.directory = directory
+        self.addresses = [(host, base_port + shard) for shard in range(shard_count(directory))]
+        self.token = secrets.token_hex(16)
+        self.processes = []
+
+    def start(self, timeout=60):
+        for shard, (host, port) in enumerate(self.addresses):
+            process = multiprocessing.Process(target=run_shard, daemon=True,
+                                              args=(shard_directory(self.directory, shard), host, port, self.token))
+            process.start()
+            self.processes.append(process)
+        deadline = time.monotonic() + timeout
+        for process, address in zip(self.processes, self.addresses):
+            while True:
+                try:
+                    socket.create_connection(address).close()
+                    break
+                except OSError:
+                    if not process.is_alive() or time.monotonic() > deadline:
+                        self.stop()
+                        raise RuntimeError(f"Shard at {address[0]}:{address[1]} did not start.")
+                    time.sleep(0.05)
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+
+
+class ShardLinks:
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.streams = {}
+
+    async def send(self, shard, request):
+        if shard not in self.streams:
+            self.streams[shard] = await asyncio.open_connection(*self.addresses[shard])
+        reader, writer = self.streams[shard]
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        line = await reader.readline()
+        if not line:
+            del self.streams[shard]
+            raise ConnectionError(f"shard {shard} closed the connection")
+        return line
+
+    async def call(self, shard, request):
+        return json.loads(await self.send(shard, request))
+
+    async def broadcast(self, request_for):
+        return await asyncio.gather(*(self.call(shard, request_for(shard)) for shard in range(len(self.addresses))))
+
+    def close(self):
+        for _, writer in self.streams.values():
+            writer.close()
+        self.streams = {}
+
+
+class ShardRouter:
+
+    def __init__(self, addresses, host="127.0.0.1", port=8765, token=None):
+        self.addresses = addresses
+        self.host = host
+        self.port = port
+        self.token = token
+        self.handlers = {
+            "register": self.by_username,
+            "login": self.login,
+            "admin_login": self.admin_login,
+            "logout": self.logout,
+            "products": self.catalog,
+            "search": self.catalog,
+            "add_product": self.add_product,
+            "remove_product": self.remove_product,
+            "modify_product": self.modify_product,
+            "metrics": self.metrics
+        }
+        for op in USER_OPS:
+            self.handlers[op] = self.by_session
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, reuse_port=True)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        links = ShardLinks(self.addresses)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.dispatch(links, line)
+                writer.write(response if isinstance(response, bytes) else (json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            links.close()
+            writer.close()
+
+    async def dispatch(self, links, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "Malformed request."}
+        if not isinstance(request, dict) or not isinstance(request.get("op"), str):
+            return {"ok": False, "error": "Malformed request."}
+        handler = self.handlers.get(request["op"])
+        if not handler:
+            return {"ok": False, "error": "Unknown operation."}
+        try:
+            return await handler(links, request)
+        except ServiceError as e:
+            return {"ok": False, "error": str(e)}
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}
+        except OSError as e:
+            return {"ok": False, "error": f"Shard unavailable: {e}"}
+
+    def user_session(self, request):
+        shard, _, token = str(request.get("session", "")).partition(":")
+        if not shard.isdigit() or int(shard) >= len(self.addresses):
+            raise ServiceError("Not logged in.")
+        return int(shard), dict(request, session=token)
+
+    def admin_sessions(self, request):
+        shard, _, tokens = str(request.get("session", "")).partition(":")
+        tokens = tokens.split(",")
+        if shard != "*" or len(tokens) != len(self.addresses):
+            raise ServiceError("Not logged in.")
+        return tokens
+
+    async def by_username(self, links, request):
+        return await links.send(shard_for(request["username"], len(self.addresses)), request)
+
+    async def by_session(self, links, request):
+        shard, request = self.user_session(request)
+        line = await links.send(shard, request)
+        if request["op"] in ("add_to_cart", "checkout") and len(self.addresses) > 1 and self.token:
+            error = json.loads(line).get("error", "")
+            if error.startswith(OUT_OF_STOCK) and await self.borrow_for(links, shard, request):
+                line = await links.send(shard, request)
+        return line
+
+    async def borrow_for(self, links, shard, request):
+        if request["op"] == "add_to_cart":
+            wanted = [(int(request["product_id"]), int(request["quantity"]))]
+        else:
+            cart = await links.call(shard, {"op": "view_cart", "session": request["session"]})
+            wanted = [(item["product_id"], item["quantity"]) for item in cart.get("items", [])]
+        received = 0
+        for product_id, quantity in wanted:
+            received += await self.borrow(links, shard, product_id, quantity)
+        return received
+
+    async def borrow(self, links, shard, product_id, quantity):
+        received = 0
+        shards = len(self.addresses)
+        for lender in ((shard + offset) % shards for offset in range(1, shards)):
+            if received >= quantity:
+                break
+            response = await links.call(lender, {"op": "lend_stock", "token": self.token, "product_id": product_id,
+                                                 "quantity": quantity - received})
+            lent = response.get("lent", 0)
+            if not lent:
+                continue
+            receive = {"op": "receive_stock", "token": self.token, "product_id": product_id, "quantity": lent}
+            try:
+                response = await links.call(shard, receive)
+            except OSError:
+                response = {}
+            if not response.get("ok"):
+                await links.call(lender, receive)
+                break
+            received += lent
+        return received
+
+    async def login(self, links, request):
+        shard = shard_for(request["username"], len(self.addresses))
+        response = await links.call(shard, request)
+        if response.get("ok"):
+            response["session"] = f"{shard}:{response['session']}"
+        return response
+
+    async def admin_login(self, links, request):
+        responses = await links.broadcast(lambda shard: request)
+        failed = next((response for response in responses if not response.get("ok")), None)
+        if failed:
+            return failed
+        return {"ok": True, "session": "*:" + ",".join(response["session"] for response in responses)}
+
+    async def logout(self, links, request):
+        if str(request.get("session", "")).startswith("*:"):
+            tokens = self.admin_sessions(request)
+            await links.broadcast(lambda shard: dict(request, session=tokens[shard]))
+            return {"ok": True}
+        return await links.send(*self.user_session(request))
+
+    async def catalog(self, links, request):
+        responses = await links.broadcast(lambda shard: request)
+        return self.merge_stock(responses, "products")
+
+    async def add_product(self, links, request):
+        tokens = self.admin_sessions(request)
+        stock = int(request["stock"])
+        shards = len(self.addresses)
+        first = await links.call(0, dict(request, session=tokens[0], stock=split_stock(stock, shards, 0)))
+        if not first.get("ok"):
+            return first
+        product_id = first["product"]["product_id"]
+        responses = [first] + list(await asyncio.gather(*(
+            links.call(shard, dict(request, session=tokens[shard], product_id=product_id,
+                                   stock=split_stock(stock, shards, shard)))
+            for shard in range(1, shards))))
+        return self.merge_stock(responses, "product")
+
+    async def modify_product(self, links, request):
+        tokens = self.admin_sessions(request)
+        if "stock" in request:
+            stock = int(request["stock"])
+            responses = await links.broadcast(lambda shard: dict(
+                request, session=tokens[shard], stock=split_stock(stock, len(self.addresses), shard)))
+        else:
+            responses = await links.broadcast(lambda shard: dict(request, session=tokens[shard]))
+        return self.merge_stock(responses, "product")
+
+    async def remove_product(self, links, request):
+        tokens = self.admin_sessions(request)
+        responses = await links.broadcast(lambda shard: dict(request, session=tokens[shard]))
+        return next((response for response in responses if not response.get("ok")), {"ok": True})
+
+    async def metrics(self, links, request):
+        tokens = self.admin_sessions(request)
+        responses = await links.broadcast(lambda shard: dict(request, session=tokens[shard]))
+        failed = next((response for response in responses if not response.get("ok")), None)
+        return failed or {"ok": True, "shards": [response["metrics"] for response in responses]}
+
+    @staticmethod
+    def merge_stock(responses, field):
+        failed = next((response for response in responses if not response.get("ok")), None)
+        if failed:
+            return failed
+        rows = [response[field] if field == "products" else [response[field]] for response in responses]
+        stock = {}
+        for products in rows:
+            for p in products:
+                stock[p['product_id']] = stock.get(p['product_id'], 0) + p['stock']
+        for p in rows[0]:
+            p['stock'] = stock[p['product_id']]
+        return responses[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve or reshard a user store split across worker processes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="start one worker per shard behind a router")
+    serve.add_argument("directory")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765, help="router port; shards listen on the ports after it")
+    serve.add_argument("--routers", type=int, default=1, help="router processes sharing the router port")
+    split = commands.add_parser("reshard", help="split a store (sharded or not) into a new directory, offline")
+    split.add_argument("source")
+    split.add_argument("target")
+    split.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if args.command == "reshard":
+        reshard(args.source, args.target, args.shards)
+        print(f"Wrote {args.shards} shards to {args.target}.")
+    else:
+        try:
+            cluster = ShardCluster(args.directory, args.host, args.port + 1)
+        except OSError as e:
+            print(f"Error opening shards: {e}. Run the reshard command first.")
+            raise SystemExit(1)
+        cluster.start()
+        routers = [multiprocessing.Process(target=run_router, daemon=True,
+                                           args=(cluster.addresses, args.host, args.port, cluster.token))
+                   for _ in range(args.routers - 1)]
+        for router in routers:
+            router.start()
+        try:
+            run_router(cluster.addresses, args.host, args.port, cluster.token)
+        finally:
+            for router in routers:
+                router.terminate()
+            cluster.stop()